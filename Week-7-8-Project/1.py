@@ -1,7 +1,9 @@
 """ 
   Saves CSV with headers:
   participant_id, timestamp, block, half, trial_in_block, num_dots, connectedness,
-  test_on_left, choice_side, test_side, chose_test (1/0), rt_ms, pattern_signature
+  test_on_left, choice_side, test_side, chose_test (1/0), rt_ms, test_pattern_id, reference_pattern_id
+  The pattern ids index a pattern table (full dot/line geometry, stored once per session)
+  saved next to the CSV as connectedness_patterns_<participant>_<timestamp>.json
 """
 
 import expyriment
@@ -10,6 +12,7 @@ from expyriment.misc.constants import C_BLACK, C_GREEN, K_SPACE, K_LEFT, K_RIGHT
 import random
 import math
 import csv
+import json
 import time
 import os
 from datetime import datetime
@@ -381,6 +384,21 @@ def generate_test_pool():
     random.shuffle(test_patterns)
     return test_patterns
 
+# -----------------------
+# PATTERN TABLE
+# Every pattern used in the session gets a compact integer id (its index in the table);
+# trial rows store ids and the geometry is written once with write_pattern_table.
+# -----------------------
+def register_patterns(table, patterns):
+    for p in patterns:
+        p['id'] = len(table)
+        table.append(p)
+
+def write_pattern_table(filename, table):
+    with open(filename, 'w') as f:
+        json.dump([{'id': p['id'], 'n_dots': p['n_dots'], 'n_connection': p['n_connection'],
+                    'dots': p['dots'], 'lines': p['lines'], 'pairs': p.get('pairs', [])} for p in table], f)
+
 # -----------------------
 # CREATE & PRELOAD CANVASES
 # -----------------------
@@ -420,8 +438,7 @@ def create_trial_list(reference_patterns, test_patterns, block_num):
             'test_on_left': test_on_left,
             'num_dots': test['n_dots'],
             'connectedness': test['n_connection'],
-            'is_practice': False,
-            'pattern_sig': pattern_signature(test)
+            'is_practice': False
         }
         trials.append(trial)
     # second half: same trials with reversed positions
@@ -438,18 +455,19 @@ def create_trial_list(reference_patterns, test_patterns, block_num):
         t['trial_number_in_block'] = idx
     return full
 
-def create_practice_trials():
+def create_practice_trials(pattern_table):
     trials = []
     for i in range(NUM_PRACTICE_TRIALS):
         test_dots = generate_dots(PRACTICE_TEST_DOTS)
         test_lines = generate_free_lines(NUM_LINES, test_dots)
         test_pattern = {'dots': test_dots, 'lines': test_lines, 'pairs': [], 'n_dots': PRACTICE_TEST_DOTS, 'n_connection': 0}
         ref_pattern = generate_reference_pattern()
+        register_patterns(pattern_table, [test_pattern, ref_pattern])
         trial = {
             'block': 0, 'half': 0, 'trial_in_half': i+1,
             'reference_pattern': ref_pattern, 'test_pattern': test_pattern,
             'test_on_left': random.choice([True, False]), 'num_dots': PRACTICE_TEST_DOTS,
-            'connectedness': 0, 'is_practice': True, 'pattern_sig': pattern_signature(test_pattern)
+            'connectedness': 0, 'is_practice': True
         }
         trials.append(trial)
     return trials
@@ -500,23 +518,26 @@ def run_experiment(participant_id=None):
 
     # data header
     headers = ['participant_id','timestamp','block','half','trial_in_block','trial_number_in_block',
-               'num_dots','connectedness','test_on_left','choice_side','test_side','chose_test','rt_ms','pattern_signature']
+               'num_dots','connectedness','test_on_left','choice_side','test_side','chose_test','rt_ms',
+               'test_pattern_id','reference_pattern_id']
 
     # generate patterns (may take time)
     print("Generating patterns (may take a minute)...")
     reference_pool = generate_reference_pool()
     test_pool = generate_test_pool()
     print("Pattern generation done.")
+    pattern_table = []
+    register_patterns(pattern_table, reference_pool)
+    register_patterns(pattern_table, test_pool)
 
-    # preload canvases for first half-block
+    # preload canvases for first half-block (keyed by pattern id)
     preload = {}
     preload_count = min(TRIALS_PER_HALF_BLOCK, len(test_pool), len(reference_pool))
     for i in range(preload_count):
         r = reference_pool[i]; t = test_pool[i]
         for pat, side in [(r,'ref'), (t,'test')]:
-            sig = pattern_signature(pat)
             # create L and R canvas
-            keyL = (sig, 'L'); keyR = (sig, 'R')
+            keyL = (pat['id'], 'L'); keyR = (pat['id'], 'R')
             if keyL not in preload:
                 preload[keyL] = create_pattern_canvas(pat, -HEMIFIELD_OFFSET)
                 preload[keyR] = create_pattern_canvas(pat, HEMIFIELD_OFFSET)
@@ -540,7 +561,7 @@ Press SPACE to start.""")
     exp.keyboard.wait(K_SPACE)
 
     # practice
-    practice_trials = create_practice_trials()
+    practice_trials = create_practice_trials(pattern_table)
     stimuli.TextScreen("Practice", "Practice trials. Press SPACE to start.").present()
     exp.keyboard.wait(K_SPACE)
     data_rows = []
@@ -549,7 +570,7 @@ Press SPACE to start.""")
         # build canvases
         left_pat = t['test_pattern'] if t['test_on_left'] else t['reference_pattern']
         right_pat = t['reference_pattern'] if t['test_on_left'] else t['test_pattern']
-        left_key = (pattern_signature(left_pat),'L'); right_key = (pattern_signature(right_pat),'R')
+        left_key = (left_pat['id'],'L'); right_key = (right_pat['id'],'R')
         left_canvas = preload.get(left_key) or create_pattern_canvas(left_pat, -HEMIFIELD_OFFSET)
         right_canvas = preload.get(right_key) or create_pattern_canvas(right_pat, HEMIFIELD_OFFSET)
         key, rt = present_pair_and_get_response(exp, left_canvas, right_canvas, fixation)
@@ -563,7 +584,7 @@ Press SPACE to start.""")
             t['num_dots'], t['connectedness'],
             t['test_on_left'],
             choice_side, test_side, chose_test, rt,
-            str(t['pattern_sig'])
+            t['test_pattern']['id'], t['reference_pattern']['id']
         ]
         data_rows.append(row)
 
@@ -584,7 +605,7 @@ Press SPACE to start.""")
                 left_pat = t['test_pattern']; right_pat = t['reference_pattern']
             else:
                 left_pat = t['reference_pattern']; right_pat = t['test_pattern']
-            left_key = (pattern_signature(left_pat),'L'); right_key = (pattern_signature(right_pat),'R')
+            left_key = (left_pat['id'],'L'); right_key = (right_pat['id'],'R')
             left_canvas = preload.get(left_key) or create_pattern_canvas(left_pat, -HEMIFIELD_OFFSET)
             right_canvas = preload.get(right_key) or create_pattern_canvas(right_pat, HEMIFIELD_OFFSET)
             # present & response
@@ -599,7 +620,7 @@ Press SPACE to start.""")
                 t['num_dots'], t['connectedness'],
                 t['test_on_left'],
                 choice_side, test_side, chose_test, rt,
-                str(t['pattern_sig'])
+                t['test_pattern']['id'], t['reference_pattern']['id']
             ]
             data_rows.append(row)
         # break between blocks
@@ -617,6 +638,9 @@ Press SPACE to start.""")
     fname = f"connectedness_data_{participant_id or 'p'}_{timestamp}.csv"
     write_csv(fname, data_rows, headers)
     print(f"Saved CSV to: {os.path.abspath(fname)}")
+    table_fname = f"connectedness_patterns_{participant_id or 'p'}_{timestamp}.json"
+    write_pattern_table(table_fname, pattern_table)
+    print(f"Saved pattern table to: {os.path.abspath(table_fname)}")
     return fname
 
 # -----------------------
@@ -150,6 +150,132 @@ class DotPattern:
         if free_lines_needed>0:
             self.lines = generate_free_lines(free_lines_needed, self.dots, self.lines)
 
+# ==============================
+# INCREMENTAL PATTERN EDITOR
+# ==============================
+class PatternEditor:
+    """
+    Editable copy of a pattern. Dots live in a spatial hash with MIN_DOT_DISTANCE cells, so a
+    spacing check only looks at the 3x3 neighbouring cells. Inserting or deleting a dot only
+    drops the lines it invalidates; to_pattern() then tops the lines back up.
+    """
+    def __init__(self, dots, lines=(), connected_pairs=()):
+        self.cell = MIN_DOT_DISTANCE
+        self.dots = {}          # id -> (x, y), in insertion order
+        self.grid = {}          # (cx, cy) -> set of dot ids
+        self.next_id = 0
+        ids = [self._add(d) for d in dots]
+        self.connecting = [(ids[i1], ids[i2]) for i1, i2 in connected_pairs]
+        connecting_lines = {(dots[i1], dots[i2]) for i1, i2 in connected_pairs}
+        self.free_lines = [l for l in lines if l not in connecting_lines]
+
+    def _cell_of(self, p):
+        return (int(p[0] // self.cell), int(p[1] // self.cell))
+
+    def _add(self, p):
+        dot_id = self.next_id
+        self.next_id += 1
+        self.dots[dot_id] = p
+        self.grid.setdefault(self._cell_of(p), set()).add(dot_id)
+        return dot_id
+
+    def neighbours(self, p):
+        """Ids of dots closer than MIN_DOT_DISTANCE to p."""
+        cx, cy = self._cell_of(p)
+        found = []
+        for gx in (cx-1, cx, cx+1):
+            for gy in (cy-1, cy, cy+1):
+                for dot_id in self.grid.get((gx, gy), ()):
+                    if distance(p, self.dots[dot_id]) < MIN_DOT_DISTANCE:
+                        found.append(dot_id)
+        return found
+
+    def insert_dot(self, p):
+        """Add dot p if it keeps MIN_DOT_DISTANCE to all dots; lines passing too close to it are dropped."""
+        if self.neighbours(p):
+            return None
+        dot_id = self._add(p)
+        self.free_lines = [l for l in self.free_lines
+                           if point_to_segment_distance(p, l[0], l[1]) >= MIN_LINE_DOT_DISTANCE]
+        self.connecting = [(a, b) for a, b in self.connecting
+                           if point_to_segment_distance(p, self.dots[a], self.dots[b]) >= MIN_LINE_DOT_DISTANCE]
+        return dot_id
+
+    def _random_position(self):
+        return (random.randint(-PATTERN_WIDTH//2+MIN_DOT_BOUNDARY_DISTANCE, PATTERN_WIDTH//2-MIN_DOT_BOUNDARY_DISTANCE),
+                random.randint(-PATTERN_HEIGHT//2+MIN_DOT_BOUNDARY_DISTANCE, PATTERN_HEIGHT//2-MIN_DOT_BOUNDARY_DISTANCE))
+
+    def insert_random_dot(self, attempts_max=2000, max_moves=50):
+        """
+        Insert a dot at a random valid position. If the pattern has no room left, one existing dot
+        is moved to a position where it is the only conflict, and insertion is tried again.
+        """
+        for _ in range(max_moves + 1):
+            for _ in range(attempts_max):
+                dot_id = self.insert_dot(self._random_position())
+                if dot_id is not None:
+                    return dot_id
+            for _ in range(attempts_max):
+                p = self._random_position()
+                blocking = self.neighbours(p)
+                if len(blocking) == 1:
+                    self.delete_dot(blocking[0])
+                    self.insert_dot(p)
+                    break
+        raise RuntimeError("Cannot place dot")
+
+    def delete_dot(self, dot_id):
+        """Remove a dot; only connecting lines ending at it are dropped (free lines stay valid)."""
+        p = self.dots.pop(dot_id)
+        self.grid[self._cell_of(p)].discard(dot_id)
+        self.connecting = [(a, b) for a, b in self.connecting if dot_id not in (a, b)]
+
+    def delete_random_dot(self):
+        self.delete_dot(random.choice(list(self.dots)))
+
+    def to_pattern(self, n_connection, max_moves=50):
+        """
+        DotPattern with n_connection connecting lines and NUM_LINES lines in total, reusing valid lines.
+        While the connecting lines cannot all be placed, one unconnected dot is moved to a new random
+        position and placement is tried again.
+        """
+        for _ in range(max_moves + 1):
+            dots, pairs, lines, free_lines = self._connect(n_connection)
+            if len(pairs) == n_connection:
+                break
+            kept = {dot_id for pr in self.connecting[:n_connection] for dot_id in pr}
+            self.delete_dot(random.choice([dot_id for dot_id in self.dots if dot_id not in kept]))
+            self.insert_random_dot()
+        else:
+            raise RuntimeError("Cannot place connecting lines")
+        pattern = DotPattern(dots, n_connection)
+        pattern.connected_pairs = pairs
+        pattern.lines = lines + free_lines
+        free_lines_needed = NUM_LINES - len(pattern.lines)
+        if free_lines_needed>0:
+            pattern.lines = generate_free_lines(free_lines_needed, dots, pattern.lines)
+        return pattern
+
+    def _connect(self, n_connection):
+        """(dots, pairs, connecting lines, free lines) with up to n_connection pairs; pairs may fall short."""
+        ids = list(self.dots)
+        index = {dot_id: i for i, dot_id in enumerate(ids)}
+        dots = [self.dots[dot_id] for dot_id in ids]
+        pairs = [(index[a], index[b]) for a, b in self.connecting[:n_connection]]
+        lines = [(dots[i1], dots[i2]) for i1, i2 in pairs]
+        # keep as many free lines as leave room for the connecting lines
+        free_lines = list(self.free_lines)
+        random.shuffle(free_lines)
+        free_lines = free_lines[:NUM_LINES - n_connection]
+        if len(pairs) < n_connection:
+            used = {i for pr in pairs for i in pr}
+            free_dots = [d for i, d in enumerate(dots) if i not in used]
+            new_lines, new_pairs = generate_connecting_lines(free_dots, n_connection - len(pairs), lines + free_lines)
+            free_index = [i for i in range(len(dots)) if i not in used]
+            pairs += [(free_index[i1], free_index[i2]) for i1, i2 in new_pairs]
+            lines += new_lines[len(lines) + len(free_lines):]
+        return dots, pairs, lines, free_lines
+
 # ==============================
 # REFERENCE & TEST GENERATION
 # ==============================
@@ -167,18 +293,14 @@ def generate_test_patterns(ref_patterns):
     for pattern in ref_patterns:
         for connectedness in CONNECTEDNESS_LEVELS:
             for n_dots in TEST_DOT_NUMBERS:
-                # Copy reference dots
-                test_dots = list(pattern.dots)
-                if n_dots>NUM_REFERENCE_DOTS:
-                    # add extra dots
-                    extra = generate_dots(n_dots-NUM_REFERENCE_DOTS)
-                    test_dots.extend(extra)
-                elif n_dots<NUM_REFERENCE_DOTS:
-                    # remove dots randomly
-                    test_dots = random.sample(test_dots,n_dots)
-                test_pattern = DotPattern(test_dots, connectedness)
-                test_pattern.generate_lines()
-                test_patterns.append(test_pattern)
+                # Edit a copy of the reference: extra dots keep their spacing to the existing ones,
+                # and only lines invalidated by the edits are replaced
+                editor = PatternEditor(pattern.dots, pattern.lines, pattern.connected_pairs)
+                for _ in range(n_dots-NUM_REFERENCE_DOTS):
+                    editor.insert_random_dot()
+                for _ in range(NUM_REFERENCE_DOTS-n_dots):
+                    editor.delete_random_dot()
+                test_patterns.append(editor.to_pattern(connectedness))
     return test_patterns
 
 # ==============================
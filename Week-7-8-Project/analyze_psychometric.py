@@ -0,0 +1,196 @@
+"""
+Psychometric fitting across participants.
+
+Loads every data file written by run_experiment (CSV from write_csv in 1.py, or expyriment
+.xpd files from merged_checked.py), fits a logistic psychometric function of P(chose_test)
+versus num_dots separately for each connectedness level, and reports PSE and slope per
+participant and for the group.
+
+Usage:
+  python analyze_psychometric.py data/ more_data/*.csv --jobs 8 --out fits.csv
+"""
+
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+TEST_DOT_NUMBERS = [9, 10, 11, 12, 13, 14, 15]
+CONNECTEDNESS_LEVELS = [0, 1, 2]
+
+DATA_EXTENSIONS = ('.csv', '.xpd')
+TIMELINE_SUFFIX = '_timeline.csv'   # merged_checked.py's stage timelines, written next to the .xpd files
+TRUE_STRINGS = {'1', 'true', 'True', 'TRUE'}
+
+# -----------------------
+# LOADING
+# -----------------------
+def find_data_files(paths):
+    """
+    Expand directories into the data files they contain (non-recursive), keep files as given.
+    Stage timeline files in a directory are skipped.
+    """
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for name in sorted(os.listdir(p)):
+                if name.endswith(DATA_EXTENSIONS) and not name.endswith(TIMELINE_SUFFIX):
+                    files.append(os.path.join(p, name))
+        else:
+            files.append(p)
+    return files
+
+def load_participant_file(path):
+    """
+    Read one data file and return (participant, num_dots, connectedness, chose_test) with the
+    last three as int arrays. Practice trials (block 0) are dropped.
+    """
+    with open(path, newline='') as f:
+        # .xpd files are CSV preceded by '#' header/comment lines
+        rows = csv.reader(line for line in f if not line.startswith('#'))
+        header = next(rows)
+        col = {name: i for i, name in enumerate(header)}
+        if 'participant_id' in col:       # 1.py
+            id_col = col['participant_id']
+        else:                             # merged_checked.py (.xpd)
+            id_col = col['subject_id']
+        block_col = col['block']; dots_col = col['num_dots']
+        conn_col = col['connectedness']; chose_col = col['chose_test']
+        participant = None
+        num_dots = []; connectedness = []; chose_test = []
+        for row in rows:
+            if not row or int(row[block_col]) == 0:
+                continue
+            if participant is None:
+                participant = row[id_col]
+            num_dots.append(int(row[dots_col]))
+            connectedness.append(int(row[conn_col]))
+            chose_test.append(1 if row[chose_col] in TRUE_STRINGS else 0)
+    if not participant:
+        participant = os.path.splitext(os.path.basename(path))[0]
+    return (participant,
+            np.asarray(num_dots, dtype=np.int64),
+            np.asarray(connectedness, dtype=np.int64),
+            np.asarray(chose_test, dtype=np.int64))
+
+def load_all(files, jobs=None):
+    """Load files in parallel across processes; returns a list in the order of files."""
+    if jobs == 1 or len(files) < 2:
+        return [load_participant_file(f) for f in files]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(load_participant_file, files, chunksize=max(1, len(files) // 32)))
+
+def count_table(datasets, dot_levels=TEST_DOT_NUMBERS, conn_levels=CONNECTEDNESS_LEVELS):
+    """
+    Aggregate trials into count arrays of shape (participants, connectedness, dot levels):
+    n = number of trials, k = number of chose_test responses.
+    """
+    dot_index = {d: i for i, d in enumerate(dot_levels)}
+    conn_index = {c: i for i, c in enumerate(conn_levels)}
+    n_p = len(datasets)
+    n = np.zeros((n_p, len(conn_levels), len(dot_levels)))
+    k = np.zeros_like(n)
+    for p, (_, num_dots, connectedness, chose_test) in enumerate(datasets):
+        di = np.array([dot_index.get(d, -1) for d in num_dots.tolist()], dtype=np.int64)
+        ci = np.array([conn_index.get(c, -1) for c in connectedness.tolist()], dtype=np.int64)
+        keep = (di >= 0) & (ci >= 0)
+        np.add.at(n[p], (ci[keep], di[keep]), 1)
+        np.add.at(k[p], (ci[keep], di[keep]), chose_test[keep])
+    return n, k
+
+# -----------------------
+# FITTING
+# -----------------------
+def fit_logistic(n, k, x, n_iter=50, ridge=1e-3, tol=1e-8):
+    """
+    Fit P(chose_test) = 1 / (1 + exp(-(a + b*x))) by Newton-Raphson on the binomial likelihood,
+    vectorized over all leading dimensions of n and k (e.g. participants x connectedness).
+
+    x is the stimulus axis (num_dots), centred internally for numerical stability. A small ridge
+    keeps fits finite for participants with (near) perfect separation.
+    Returns (pse, slope), each with shape n.shape[:-1]; PSE is NaN where no slope could be fitted.
+    """
+    x = np.asarray(x, dtype=float)
+    x0 = x.mean()
+    xc = x - x0
+    a = np.zeros(n.shape[:-1])
+    b = np.zeros(n.shape[:-1])
+    for _ in range(n_iter):
+        eta = a[..., None] + b[..., None] * xc
+        p = 1.0 / (1.0 + np.exp(-eta))
+        w = n * p * (1.0 - p)
+        r = k - n * p
+        # gradient and (negated) Hessian of the penalised log-likelihood
+        g_a = r.sum(-1) - ridge * a
+        g_b = (r * xc).sum(-1) - ridge * b
+        h_aa = w.sum(-1) + ridge
+        h_ab = (w * xc).sum(-1)
+        h_bb = (w * xc * xc).sum(-1) + ridge
+        det = h_aa * h_bb - h_ab * h_ab
+        da = (h_bb * g_a - h_ab * g_b) / det
+        db = (h_aa * g_b - h_ab * g_a) / det
+        a += da
+        b += db
+        if max(np.abs(da).max(initial=0), np.abs(db).max(initial=0)) < tol:
+            break
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pse = np.where(np.abs(b) > 1e-6, x0 - a / b, np.nan)
+    has_data = n.sum(-1) > 0
+    pse = np.where(has_data, pse, np.nan)
+    slope = np.where(has_data, b, np.nan)
+    return pse, slope
+
+def fit_all(datasets, dot_levels=TEST_DOT_NUMBERS, conn_levels=CONNECTEDNESS_LEVELS):
+    """
+    Fit every participant and the pooled group at once.
+    Returns (participants, pse, slope, group_pse, group_slope) where pse/slope have shape
+    (participants, connectedness) and the group arrays have shape (connectedness,).
+    """
+    n, k = count_table(datasets, dot_levels, conn_levels)
+    pse, slope = fit_logistic(n, k, dot_levels)
+    group_pse, group_slope = fit_logistic(n.sum(0), k.sum(0), dot_levels)
+    participants = [d[0] for d in datasets]
+    return participants, pse, slope, group_pse, group_slope
+
+# -----------------------
+# REPORTING
+# -----------------------
+def result_rows(participants, pse, slope, group_pse, group_slope, conn_levels=CONNECTEDNESS_LEVELS):
+    rows = []
+    for p, pid in enumerate(participants):
+        for c, conn in enumerate(conn_levels):
+            rows.append([pid, conn, pse[p, c], slope[p, c]])
+    for c, conn in enumerate(conn_levels):
+        rows.append(['group_pooled', conn, group_pse[c], group_slope[c]])
+        rows.append(['group_mean', conn, np.nanmean(pse[:, c]), np.nanmean(slope[:, c])])
+        rows.append(['group_sd', conn, np.nanstd(pse[:, c], ddof=1), np.nanstd(slope[:, c], ddof=1)])
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit psychometric functions for all participants.")
+    parser.add_argument('paths', nargs='+', help="data files (.csv/.xpd) or directories containing them")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes for loading (default: CPU count)")
+    parser.add_argument('--out', default=None, help="write results CSV here instead of stdout")
+    args = parser.parse_args(argv)
+
+    files = find_data_files(args.paths)
+    if not files:
+        parser.error("no data files found")
+    datasets = load_all(files, args.jobs)
+    rows = result_rows(*fit_all(datasets))
+
+    out = open(args.out, 'w', newline='') if args.out else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(['participant', 'connectedness', 'pse', 'slope'])
+        writer.writerows([r[0], r[1], f"{r[2]:.4f}", f"{r[3]:.4f}"] for r in rows)
+    finally:
+        if args.out:
+            out.close()
+    print(f"Fitted {len(datasets)} participants from {len(files)} files.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Asyncio-based session runtime for merged_checked.py.
+
+Same session as merged_checked.run_experiment (instructions, practice, NUM_BLOCKS main blocks, same
+data columns), but nothing is prepared up front. Presentation and response timing run in the
+foreground coroutine; pattern generation, canvas prerendering, cache eviction and data flushing run
+as background coroutines that only get to execute one small step at a time inside the foreground's
+idle gaps (ITI, fixation, stimulus duration and instruction waits). Background steps stop a guard
+interval before every presentation deadline, so per-trial timing is unchanged, while the first
+trial no longer waits for the whole pattern pool.
+
+A step cannot be interrupted, so the guard must cover the longest step: generation runs on the step
+generators of merged_checked (mc.CANDIDATES_PER_STEP candidates per step, well under 1 ms), rendering
+and saving take one canvas or one save per step. The guard starts at STEP_GUARD_MS and grows to the
+longest step measured so far; the data file reports the longest step, the final guard and the steps
+that took longer than the guard in force when they started (the only ones that can delay an onset).
+While a trial response is pending no background step runs, so keys are polled continuously and RT
+does not depend on step length.
+
+Usage:
+  python async_runtime.py [--simulate] [--fast-forward]
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+
+from expyriment import design, control, stimuli
+from expyriment.misc.constants import C_GREEN, K_SPACE, K_LEFT, K_RIGHT
+
+import merged_checked as mc
+
+STEP_GUARD_MS = 10       # minimum gap between the last background step start and a deadline
+DATA_SAVE_EVERY = 24     # trials between background data-file saves
+
+# Background priorities (lower runs first)
+PRIO_PRACTICE = 0
+PRIO_FLUSH = 1
+PRIO_GENERATION = 2
+PRIO_PRERENDER = 3
+PRIO_EVICTION = 4
+
+# -----------------------
+# Idle-gap scheduling
+# -----------------------
+class IdleGate:
+    """Admits background coroutines one step at a time, only while the foreground is idle."""
+    def __init__(self):
+        self._open = asyncio.Event()
+        self._deadline_ns = None
+        self.guard_ns = STEP_GUARD_MS * 1000000    # no step starts later than this before the deadline
+
+    def open(self, deadline_ns=None):
+        self._deadline_ns = deadline_ns
+        self._open.set()
+
+    def close(self):
+        self._open.clear()
+
+    def admits(self):
+        """True while a step started now still ends (at the guard's length) before the deadline."""
+        return self._deadline_ns is None or time.perf_counter_ns() < self._deadline_ns - self.guard_ns
+
+    async def step(self):
+        while True:
+            await self._open.wait()
+            if self.admits():
+                return
+            self._open.clear()
+
+class AsyncSession:
+    def __init__(self, exp, observer=None, fast_forward=False):
+        self.exp = exp
+        self.observer = observer
+        self.fast_forward = fast_forward
+        self.gate = IdleGate()
+        self.preload_cache = {}
+        self.summary = mc.OnlineSummary()
+        self.timeline = None
+        self.timeline_path = None
+        self.fixation_cross = None
+        self._n_trials = 0
+        self._work = []                  # heap of (priority, seq, steps, future)
+        self._seq = itertools.count()
+        self._work_added = None
+        self.longest_step_ns = 0
+        self.steps_over_guard = 0
+
+    # --- background work ---
+    def spawn(self, steps, priority=PRIO_PRERENDER):
+        """
+        Queue an iterable of small work steps to run in idle gaps. Returns a future resolved with
+        the generator's return value once all its steps are done.
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._work, (priority, next(self._seq), iter(steps), future))
+        self._work_added.set()
+        return future
+
+    async def _background_worker(self):
+        """Single consumer of the work heap: one step of the most urgent item per admitted gap."""
+        while True:
+            if not self._work:
+                self._work_added.clear()
+                await self._work_added.wait()
+                continue
+            await self.gate.step()
+            _, _, steps, future = self._work[0]
+            step_start = time.perf_counter_ns()
+            try:
+                next(steps)
+            except StopIteration as stop:
+                heapq.heappop(self._work)
+                future.set_result(stop.value)
+            except Exception as e:
+                heapq.heappop(self._work)
+                future.set_exception(e)
+            step_ns = time.perf_counter_ns() - step_start
+            if step_ns > self.gate.guard_ns:
+                self.steps_over_guard += 1
+                self.gate.guard_ns = step_ns
+            self.longest_step_ns = max(self.longest_step_ns, step_ns)
+            # hand control back to the foreground after every step
+            await asyncio.sleep(0)
+
+    async def drain(self, future):
+        """Foreground has nothing else to do: let background work run until future is resolved."""
+        self.gate.open(None)
+        while not future.done():
+            await asyncio.sleep(0)
+        self.gate.close()
+        return future.result()
+
+    # --- foreground waits ---
+    async def idle(self, ms):
+        """Wait ms milliseconds, running background steps until the guard interval before the deadline."""
+        if self.fast_forward:
+            # virtual time: no real gap, but still let one background step through
+            self.exp.clock.wait(ms)
+            self.gate.open(None)
+            await asyncio.sleep(0)
+            self.gate.close()
+            return
+        deadline = time.perf_counter_ns() + int(ms * 1000000)
+        self.gate.open(deadline)
+        while self.gate.admits():
+            await asyncio.sleep(0)
+        self.gate.close()
+        while time.perf_counter_ns() < deadline:
+            pass
+
+    async def wait_key(self, keys, trial_info=None):
+        """
+        Async counterpart of exp.keyboard.wait / the simulated observer; returns (key, rt).
+        Background work runs during instruction waits only, not during trial responses (trial_info given).
+        """
+        if self.observer is not None:
+            if trial_info is not None:
+                key, rt = self.observer.respond(trial_info)
+            else:
+                key, rt = self.observer.wait_key(keys)
+            await self.idle(rt)
+            return key, rt
+        self.exp.keyboard.clear()
+        start = time.perf_counter_ns()
+        if trial_info is None:
+            self.gate.open(None)
+        try:
+            while True:
+                key = self.exp.keyboard.check(keys)
+                if key is not None:
+                    return key, int(round((time.perf_counter_ns() - start) / 1000000))
+                await asyncio.sleep(0)
+        finally:
+            self.gate.close()
+
+    # --- trial ---
+    async def run_trial(self, trial_info):
+        exp = self.exp
+        timeline = self.timeline
+        timeline.begin_trial(trial_info.get('block', -1), trial_info.get('trial_num', -1))
+        timeline.mark(mc.EV_ITI_START)
+        await self.idle(random.randint(mc.MIN_ITI, mc.MAX_ITI))
+        left_canvas, right_canvas = mc.get_trial_canvases(trial_info, self.preload_cache)
+        self.fixation_cross.present()
+        timeline.mark(mc.EV_FIXATION_ONSET)
+        await self.idle(300)
+        screen = stimuli.BlankScreen(colour=mc.BACKGROUND_COLOR)
+        left_canvas.plot(screen)
+        right_canvas.plot(screen)
+        screen.present()
+        timeline.mark(mc.EV_STIMULUS_ONSET)
+        await self.idle(mc.STIMULUS_DURATION)
+        stimuli.BlankScreen(colour=mc.BACKGROUND_COLOR).present()
+        timeline.mark(mc.EV_STIMULUS_OFFSET)
+        key, rt = await self.wait_key([K_LEFT, K_RIGHT], trial_info)
+        timeline.mark(mc.EV_RESPONSE)
+        chose_test = mc.record_response(exp, trial_info, key, rt, self.summary, timeline)
+        self._n_trials += 1
+        if self._n_trials % DATA_SAVE_EVERY == 0:
+            self.spawn(_call_steps(exp.data.save), PRIO_FLUSH)
+        return chose_test
+
+    # --- session ---
+    async def run(self):
+        exp = self.exp
+        t_start = time.perf_counter()
+        self._work_added = asyncio.Event()
+        worker = asyncio.ensure_future(self._background_worker())
+
+        # background: practice pool first, then the main pools, then block canvases
+        practice_task = self.spawn(_practice_steps(), PRIO_PRACTICE)
+        pools_task = self.spawn(_pool_steps(), PRIO_GENERATION)
+
+        instructions = stimuli.TextScreen("Numerosity Judgment Task", text="""You will see two patterns of dots flash briefly on the screen.
+
+Your task is to decide which pattern contains MORE dots.
+
+Press the LEFT arrow key if the LEFT pattern has more dots.
+Press the RIGHT arrow key if the RIGHT pattern has more dots.
+
+Keep your eyes on the green fixation cross in the center.
+
+We will start with some practice trials.
+
+Press SPACE to begin practice.""")
+        self.fixation_cross = stimuli.FixCross(size=(20,20), colour=C_GREEN, line_width=2)
+        self.fixation_cross.preload()
+        instructions.present()
+        await self.wait_key(K_SPACE)
+
+        # Practice
+        practice = await self.drain(practice_task)
+        for t in practice:
+            self.spawn(mc.prerender_trial_steps(t, self.preload_cache), PRIO_PRACTICE)
+        stimuli.TextScreen("Practice", "Practice trials\n\nPress SPACE to start").present()
+        await self.wait_key(K_SPACE)
+        exp.data.add_experiment_info(f"time_to_first_trial_ms: {(time.perf_counter() - t_start) * 1000:.0f}")
+        for t in practice:
+            await self.run_trial(t)
+        self.spawn(_call_steps(lambda: self.timeline.flush(self.timeline_path)), PRIO_FLUSH)
+
+        stimuli.TextScreen("Practice Complete", "Practice is complete!\n\nThe main experiment will now begin.\n\nPress SPACE to continue").present()
+        await self.wait_key(K_SPACE)
+
+        # Main blocks: all blocks reuse the same pools; practice canvases are evicted
+        reference_patterns, test_patterns = await self.drain(pools_task)
+        self.spawn(_evict_steps(self.preload_cache, practice), PRIO_EVICTION)
+        for block_num in range(1, mc.NUM_BLOCKS+1):
+            stimuli.TextScreen(f"Block {block_num} of {mc.NUM_BLOCKS}", f"Starting block {block_num}\n\nPress SPACE when ready").present()
+            trials = mc.create_trial_list(reference_patterns, test_patterns, block_num)
+            for t in trials:
+                self.spawn(mc.prerender_trial_steps(t, self.preload_cache))
+            await self.wait_key(K_SPACE)
+            for t in trials:
+                await self.run_trial(t)
+            exp.data.add_experiment_info(f"Summary after block {block_num}:\n{self.summary.as_text()}")
+            flush = self.spawn(_call_steps(exp.data.save, lambda: self.timeline.flush(self.timeline_path)), PRIO_FLUSH)
+            if block_num < mc.NUM_BLOCKS:
+                stimuli.TextScreen("Break Time", f"Take a rest.\n\n{self.summary.as_text()}\n\nPress SPACE when ready to continue").present()
+                await self.wait_key(K_SPACE)
+            await self.drain(flush)
+
+        exp.data.add_experiment_info(f"longest_background_step_ms: {self.longest_step_ns / 1000000:.2f}, "
+                                     f"step_guard_ms: {self.gate.guard_ns / 1000000:.2f}, "
+                                     f"steps_over_guard: {self.steps_over_guard}")
+        stimuli.TextScreen("Experiment Complete", "Thank you for participating").present()
+        await self.idle(2000)
+        worker.cancel()
+
+# -----------------------
+# Background work items (generators: one small step per next())
+# -----------------------
+def _call_steps(*fns):
+    for fn in fns:
+        fn()
+        yield
+
+def _practice_steps():
+    practice_patterns = yield from mc.practice_pattern_steps()
+    return mc.create_practice_trials(practice_patterns)
+
+def _pool_steps():
+    master_seed = mc.new_master_seed()
+    reference_patterns = []
+    for p in mc.iter_reference_patterns(master_seed=master_seed, ticks=True):
+        if p is not None:
+            reference_patterns.append(p)
+        yield
+    test_patterns = []
+    for p in mc.iter_test_patterns(master_seed=master_seed):
+        if p is not None:
+            test_patterns.append(p)
+        yield
+    random.shuffle(reference_patterns)
+    random.shuffle(test_patterns)
+    return reference_patterns, test_patterns
+
+def _evict_steps(preload_cache, trials):
+    for t in trials:
+        for pattern in (t['reference_pattern'], t['test_pattern']):
+            key = mc.pattern_key(pattern)
+            preload_cache.pop((key, 'L'), None)
+            preload_cache.pop((key, 'R'), None)
+            yield
+
+# -----------------------
+# MAIN
+# -----------------------
+def run_experiment_async(observer=None, fast_forward=False):
+    if fast_forward:
+        mc.configure_fast_forward()
+        if observer is None:
+            observer = mc.SimulatedObserver()
+    exp = design.Experiment(name="Connectedness_Numerosity_Checked")
+    control.initialize(exp)
+    if fast_forward:
+        exp._clock = mc.VirtualClock()
+    control.set_develop_mode(False)
+    control.start(skip_ready_screen=True, auto_create_subject_id=(observer is not None) or None)
+    exp.data.add_variable_names([
+        'block','half','trial_num','num_dots','connectedness','phase','test_on_left',
+        'choice_side','test_side','chose_test','rt','rt_from_onset',
+        'reference_pattern_id','test_pattern_id'
+    ])
+    session = AsyncSession(exp, observer, fast_forward)
+    if fast_forward:
+        session.timeline = mc.TrialTimeline(clock_ns=lambda: exp.clock.time * 1000000)
+    else:
+        session.timeline = mc.TrialTimeline()
+    session.timeline_path = os.path.splitext(exp.data.fullpath)[0] + "_timeline.csv"
+    asyncio.run(session.run())
+    control.end()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Connectedness numerosity experiment (asyncio runtime)")
+    parser.add_argument("--simulate", action="store_true", help="run the session with a synthetic participant")
+    parser.add_argument("--fast-forward", action="store_true", help="run headless on virtual time (implies --simulate)")
+    args = parser.parse_args()
+    run_experiment_async(observer=mc.SimulatedObserver() if args.simulate else None,
+                         fast_forward=args.fast_forward)
@@ -0,0 +1,125 @@
+"""
+Bootstrap confidence intervals for the connectedness effect on the PSE.
+
+Takes the same data files as analyze_psychometric.py (CSV from 1.py, .xpd from merged_checked.py).
+Each replicate resamples participants with replacement and, within every participant, trials with
+replacement inside each (connectedness, num_dots) cell, then refits the psychometric functions and
+records the PSE shifts 1-0, 2-0 and 2-1 connected. Replicates are computed in chunks on a process
+pool; running CIs are printed as chunks arrive.
+
+Usage:
+  python bootstrap_connectedness.py data/ --replicates 10000 --jobs 8 --out pse_shift_ci.csv
+"""
+
+import argparse
+import csv
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from analyze_psychometric import (CONNECTEDNESS_LEVELS, TEST_DOT_NUMBERS, count_table, find_data_files,
+                                  fit_logistic, load_all)
+
+CONTRASTS = [(1, 0), (2, 0), (2, 1)]   # (connectedness a, connectedness b): PSE_a - PSE_b
+
+# -----------------------
+# REPLICATES
+# -----------------------
+_counts = None   # (n, k) arrays of shape (participants, connectedness, dots), set per worker
+
+def _init_worker(n, k):
+    global _counts
+    _counts = (n, k)
+
+def pse_shifts(pse):
+    """pse: (..., connectedness) -> (..., len(CONTRASTS))"""
+    conn_index = {c: i for i, c in enumerate(CONNECTEDNESS_LEVELS)}
+    return np.stack([pse[..., conn_index[a]] - pse[..., conn_index[b]] for a, b in CONTRASTS], axis=-1)
+
+def bootstrap_chunk(seed, n_replicates, statistic='pooled'):
+    """
+    Compute n_replicates bootstrap replicates of the PSE shifts; returns an array (n_replicates, contrasts).
+    Trial resampling within a cell is drawn as Binomial(n, k/n), which is exactly the distribution of
+    the chose_test count when that cell's n trials are resampled with replacement.
+    """
+    n, k = _counts
+    rng = np.random.default_rng(seed)
+    n_p = n.shape[0]
+    idx = rng.integers(0, n_p, size=(n_replicates, n_p))           # participant index arrays
+    n_b = n[idx]                                                     # (B, P, C, D)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p_b = np.where(n_b > 0, k[idx] / n_b, 0.0)
+    k_b = rng.binomial(n_b.astype(np.int64), p_b).astype(float)
+    if statistic == 'pooled':
+        pse, _ = fit_logistic(n_b.sum(1), k_b.sum(1), TEST_DOT_NUMBERS)          # (B, C)
+    else:
+        pse, _ = fit_logistic(n_b, k_b, TEST_DOT_NUMBERS)                         # (B, P, C)
+        pse = np.nanmean(pse, axis=1)
+    return pse_shifts(pse)
+
+def run_bootstrap(n, k, n_replicates, jobs=None, chunk_size=250, seed=None, statistic='pooled'):
+    """Yield (replicates so far, all replicate shifts so far) after every finished chunk."""
+    sizes = [chunk_size] * (n_replicates // chunk_size)
+    if n_replicates % chunk_size:
+        sizes.append(n_replicates % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    done = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(n, k)) as pool:
+        futures = [pool.submit(bootstrap_chunk, s, size, statistic) for s, size in zip(seeds, sizes)]
+        for f in as_completed(futures):
+            done.append(f.result())
+            shifts = np.concatenate(done)
+            yield len(shifts), shifts
+
+def percentile_ci(shifts, level=0.95):
+    alpha = (1 - level) / 2
+    return np.nanpercentile(shifts, [100 * alpha, 100 * (1 - alpha)], axis=0)
+
+# -----------------------
+# MAIN
+# -----------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bootstrap CIs of PSE shifts between connectedness levels.")
+    parser.add_argument('paths', nargs='+', help="data files (.csv/.xpd) or directories containing them")
+    parser.add_argument('--replicates', type=int, default=10000)
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=250, help="replicates per work item")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--level', type=float, default=0.95, help="confidence level")
+    parser.add_argument('--statistic', choices=['pooled', 'mean'], default='pooled',
+                        help="PSE of the pooled fit, or mean of per-participant PSEs")
+    parser.add_argument('--out', default=None, help="write final CIs as CSV here")
+    args = parser.parse_args(argv)
+
+    files = find_data_files(args.paths)
+    if not files:
+        parser.error("no data files found")
+    n, k = count_table(load_all(files, args.jobs))
+
+    if args.statistic == 'pooled':
+        observed = pse_shifts(fit_logistic(n.sum(0), k.sum(0), TEST_DOT_NUMBERS)[0])
+    else:
+        observed = pse_shifts(np.nanmean(fit_logistic(n, k, TEST_DOT_NUMBERS)[0], axis=0))
+
+    shifts = None
+    for n_done, shifts in run_bootstrap(n, k, args.replicates, args.jobs, args.chunk_size,
+                                        args.seed, args.statistic):
+        lo, hi = percentile_ci(shifts, args.level)
+        running = "  ".join(f"{a}-{b}: [{l:+.3f}, {h:+.3f}]" for (a, b), l, h in zip(CONTRASTS, lo, hi))
+        print(f"{n_done:>7} replicates  {running}", file=sys.stderr)
+
+    lo, hi = percentile_ci(shifts, args.level)
+    rows = [[f"{a}-{b}", f"{obs:.4f}", f"{l:.4f}", f"{h:.4f}", f"{np.nanstd(shifts[:, i], ddof=1):.4f}"]
+            for i, ((a, b), obs, l, h) in enumerate(zip(CONTRASTS, observed, lo, hi))]
+    out = open(args.out, 'w', newline='') if args.out else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(['contrast', 'pse_shift', 'ci_low', 'ci_high', 'bootstrap_se'])
+        writer.writerows(rows)
+    finally:
+        if args.out:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Brute-force cross-checks of the pattern generators and the bulk validator.
+
+brute_force_violations checks one pattern at a time with plain loops over merged_checked's own
+distance / intersection helpers, rule by rule as in validate_patterns.RULES. The checks compare
+against it:
+
+  validator   validate_patterns.validate flags exactly the brute-force rules, on generated patterns
+              and on randomly mutated copies of them
+  symmetry    every pool pattern and all of its SYMMETRY_TRANSFORMS variants pass all rules; the
+              variants share the canonical key; pool patterns are unique, and patterns from
+              different bases never share an orbit
+  editor      2.py's test patterns, derived from its references with PatternEditor, pass all rules
+  infeasible  generation under a geometry that cannot fit the pattern gives up with RuntimeError
+              (after MAX_RESTARTS restarts) instead of running forever
+
+Each check prints its counts and exits with status 1 on any disagreement.
+
+Usage:
+  python check_generators.py validator --n 3000 --seed 0
+  python check_generators.py symmetry --sets 5
+  python check_generators.py editor --references 100 --seeds 5
+  python check_generators.py infeasible
+"""
+
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import time
+
+import merged_checked as mc
+import validate_patterns as vp
+
+TOL = vp.TOLERANCE
+
+# -----------------------
+# REFERENCE CHECKER
+# -----------------------
+def _index_of(dots, point):
+    """Index of the first dot at exactly point, or None."""
+    for i, d in enumerate(dots):
+        if tuple(d) == tuple(point):
+            return i
+    return None
+
+def brute_force_violations(p):
+    """Set of the rules (validate_patterns.RULES names) that pattern p violates."""
+    bad = set()
+    dots = p['dots']
+    lines = p['lines']
+    n = len(dots)
+    half_w = mc.PATTERN_WIDTH / 2
+    half_h = mc.PATTERN_HEIGHT / 2
+    if n != p['n_dots']:
+        bad.add('dot_count')
+    for i in range(n):
+        for j in range(i + 1, n):
+            if mc.distance(dots[i], dots[j]) < mc.MIN_DOT_DISTANCE - TOL:
+                bad.add('dot_spacing')
+    for x, y in dots:
+        if (abs(x) > half_w - mc.MIN_DOT_BOUNDARY_DISTANCE + TOL or
+                abs(y) > half_h - mc.MIN_DOT_BOUNDARY_DISTANCE + TOL):
+            bad.add('dot_boundary')
+    if len(lines) != mc.NUM_LINES:
+        bad.add('line_count')
+    for l in lines:
+        for x, y in l:
+            if abs(x) > half_w + TOL or abs(y) > half_h + TOL:
+                bad.add('line_boundary')
+        length = mc.distance(l[0], l[1])
+        if length < mc.MIN_LINE_LENGTH - TOL or length > mc.MAX_LINE_LENGTH + TOL:
+            bad.add('line_length')
+
+    # a line is connecting if both its ends sit on dot centres that form a pair
+    valid_pairs = [pr for pr in p['pairs'] if all(0 <= i < n for i in pr)]
+    paired = {frozenset(pr) for pr in valid_pairs}
+    connecting = []
+    for l in lines:
+        ia = _index_of(dots, l[0])
+        ib = _index_of(dots, l[1])
+        if ia is not None and ib is not None and frozenset((ia, ib)) in paired:
+            connecting.append((ia, ib))
+        else:
+            connecting.append(None)
+    used = [i for pr in valid_pairs for i in pr]
+    if (len(p['pairs']) != p['n_connection'] or len(valid_pairs) != len(p['pairs']) or
+            len(used) != len(set(used)) or sum(c is not None for c in connecting) != p['n_connection']):
+        bad.add('connections')
+
+    for l, ends in zip(lines, connecting):
+        for i, d in enumerate(dots):
+            if ends is not None and i in ends:
+                continue
+            if mc.point_to_segment_distance(d, l[0], l[1]) < mc.MIN_LINE_DOT_DISTANCE - TOL:
+                bad.add('line_dot_clearance')
+    for i in range(len(lines)):
+        for j in range(i + 1, len(lines)):
+            if mc.lines_intersect(lines[i], lines[j]):
+                bad.add('line_intersection')
+    return bad
+
+# -----------------------
+# VALIDATOR CHECK
+# -----------------------
+def _random_line(rng):
+    return ((rng.uniform(-90, 90), rng.uniform(-130, 130)), (rng.uniform(-90, 90), rng.uniform(-130, 130)))
+
+def mutate(p, rng):
+    """Copy of p with one random edit that may break one or more rules (or none)."""
+    p = {'dots': list(p['dots']), 'lines': list(p['lines']), 'pairs': list(p['pairs']),
+         'n_dots': p['n_dots'], 'n_connection': p['n_connection'], 'id': p.get('id', '')}
+    dots, lines = p['dots'], p['lines']
+    kind = rng.randrange(10)
+    if kind == 0:                                       # jitter a dot
+        i = rng.randrange(len(dots))
+        dots[i] = (dots[i][0] + rng.randint(-30, 30), dots[i][1] + rng.randint(-30, 30))
+    elif kind == 1:                                     # dot exactly at / just under the spacing limit
+        i, j = rng.sample(range(len(dots)), 2)
+        dots[i] = (dots[j][0] + mc.MIN_DOT_DISTANCE - rng.randint(0, 1), dots[j][1])
+    elif kind == 2:                                     # dot at / just past the boundary distance
+        i = rng.randrange(len(dots))
+        dots[i] = (mc.PATTERN_WIDTH // 2 - mc.MIN_DOT_BOUNDARY_DISTANCE + rng.randint(0, 1), dots[i][1])
+    elif kind == 3:                                     # drop or duplicate a dot
+        if rng.random() < 0.5:
+            dots.pop(rng.randrange(len(dots)))
+        else:
+            dots.append(rng.choice(dots))
+    elif kind == 4:                                     # replace a line by a random segment
+        lines[rng.randrange(len(lines))] = _random_line(rng)
+    elif kind == 5:                                     # drop or add a line
+        if rng.random() < 0.5:
+            lines.pop(rng.randrange(len(lines)))
+        else:
+            lines.append(_random_line(rng))
+    elif kind == 6:                                     # stretch a line about its first end
+        i = rng.randrange(len(lines))
+        (x1, y1), (x2, y2) = lines[i]
+        s = rng.uniform(0.5, 1.5)
+        lines[i] = ((x1, y1), (x1 + s * (x2 - x1), y1 + s * (y2 - y1)))
+    elif kind == 7:                                     # a line through a dot
+        d = rng.choice(dots)
+        lines[rng.randrange(len(lines))] = ((d[0] - 20, d[1] - 5), (d[0] + 20, d[1] + 5))
+    elif kind == 8:                                     # corrupt the pairs
+        choice = rng.randrange(4)
+        if choice == 0 and p['pairs']:
+            p['pairs'].pop()
+        elif choice == 1 and p['pairs']:
+            p['pairs'][0] = (p['pairs'][0][0], rng.randrange(len(dots) + 2))
+        elif choice == 2:
+            p['pairs'].append(tuple(rng.sample(range(len(dots)), 2)))
+        else:
+            p['n_connection'] = rng.choice(mc.CONNECTEDNESS_LEVELS)
+    # kind 9: unchanged
+    return p
+
+def check_validator(n, seed):
+    rng = random.Random(seed)
+    random.seed(seed)
+    reference, test = mc.generate_all_patterns(master_seed=seed)
+    practice = mc.generate_practice_patterns(master_seed=seed)
+    patterns = reference + test + practice[0] + practice[1]
+    patterns += [mutate(rng.choice(patterns), rng) for _ in range(n)]
+    failed = vp.validate(patterns)
+    mismatches = 0
+    flagged = 0
+    per_rule = dict.fromkeys(vp.RULES, 0)
+    for i, p in enumerate(patterns):
+        got = {rule for rule in vp.RULES if failed[rule][i]}
+        expected = brute_force_violations(p)
+        flagged += bool(expected)
+        for rule in expected:
+            per_rule[rule] += 1
+        if got != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"{p.get('id') or i}: validator {sorted(got)}, brute force {sorted(expected)}")
+    print("  ".join(f"{rule} {count}" for rule, count in per_rule.items()))
+    print(f"validator: {len(patterns)} patterns ({n} mutated), {flagged} invalid, {mismatches} mismatches")
+    return mismatches == 0
+
+# -----------------------
+# SYMMETRY CHECK
+# -----------------------
+def _base_id(pattern):
+    """Id of the base a pool pattern was generated from (its first two id fields)."""
+    return '.'.join(pattern['id'].split('.')[:2])
+
+def check_symmetry(n_sets, seed):
+    failures = 0
+    n_variants = 0
+    for master_seed in range(seed, seed + n_sets):
+        random.seed(master_seed)
+        pools = dict(zip(('reference', 'test'), mc.generate_all_patterns(master_seed=master_seed)))
+        for name, pool in pools.items():
+            keys = [mc.pattern_key(p) for p in pool]
+            if len(set(keys)) != len(keys):
+                failures += 1
+                print(f"{name} pool of seed {master_seed}: {len(keys) - len(set(keys))} duplicate patterns")
+            orbit_bases = {}
+            for p in pool:
+                canonical = mc.canonical_key(p)
+                for sx, sy in mc.SYMMETRY_TRANSFORMS:
+                    v = mc.transform_pattern(p, sx, sy)
+                    n_variants += 1
+                    bad = brute_force_violations(v)
+                    if bad or mc.canonical_key(v) != canonical:
+                        failures += 1
+                        if failures <= 5:
+                            print(f"{p['id']} under {(sx, sy)}: {sorted(bad) or 'canonical key changed'}")
+                # derivations share their base's dots, so orbits are compared on the dots only
+                orbit = mc.canonical_key({'dots': p['dots'], 'lines': [], 'n_dots': p['n_dots'], 'n_connection': 0})
+                orbit_bases.setdefault(orbit, set()).add(_base_id(p))
+            shared = [bases for bases in orbit_bases.values() if len(bases) > 1]
+            if shared:
+                failures += len(shared)
+                print(f"{name} pool of seed {master_seed}: bases in one orbit: {sorted(shared[0])}")
+    print(f"symmetry: {n_sets} stimulus sets, {n_variants} variants checked, {failures} failures")
+    return failures == 0
+
+# -----------------------
+# EDITOR CHECK
+# -----------------------
+def load_script(filename, module_name):
+    """Import a script of this directory whose file name is not a valid module name (e.g. 2.py)."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def check_editor(n_references, n_seeds, seed):
+    two = load_script('2.py', 'variant_2')
+    failures = 0
+    kept = 0
+    n_tests = 0
+    for run_seed in range(seed, seed + n_seeds):
+        random.seed(run_seed)
+        references = []
+        while len(references) < n_references:
+            try:
+                p = two.DotPattern(two.generate_dots(two.NUM_REFERENCE_DOTS))
+                p.generate_lines()
+            except RuntimeError:
+                continue
+            references.append(p)
+        tests = two.generate_test_patterns(references)
+        # generate_test_patterns order: reference, then connectedness, then n_dots
+        conditions = [(ref, c, n) for ref in references for c in two.CONNECTEDNESS_LEVELS for n in two.TEST_DOT_NUMBERS]
+        for t, (ref, n_connection, n_dots) in zip(tests, conditions):
+            bad = brute_force_violations({'dots': t.dots, 'lines': t.lines, 'pairs': t.connected_pairs,
+                                          'n_dots': n_dots, 'n_connection': n_connection})
+            if bad:
+                failures += 1
+                if failures <= 5:
+                    print(f"seed {run_seed}, {n_dots} dots, {n_connection}-connected: {sorted(bad)}")
+            kept += len(set(t.dots) & set(ref.dots))
+        n_tests += len(tests)
+    print(f"editor: {n_seeds} seeds, {n_tests} derived patterns, {failures} failures, "
+          f"{kept / max(1, n_tests):.1f} of {two.NUM_REFERENCE_DOTS} reference dots kept on average")
+    return failures == 0
+
+# -----------------------
+# INFEASIBLE GEOMETRY CHECK
+# -----------------------
+INFEASIBLE_GEOMETRY = {'PATTERN_WIDTH': 100, 'PATTERN_HEIGHT': 100}
+INFEASIBLE_TIME_LIMIT = 10.0   # s per case; a generator that never gives up is stopped here
+
+def _gives_up(steps):
+    """(seconds, message) once the step generator raised RuntimeError, or None if it finished or ran out of time."""
+    start = time.perf_counter()
+    try:
+        mc.run_steps(steps, time.perf_counter_ns() + int(INFEASIBLE_TIME_LIMIT * 1e9))
+    except mc.GenerationTimeout:
+        return None
+    except RuntimeError as e:
+        return time.perf_counter() - start, str(e)
+    return None
+
+def check_infeasible(seed):
+    saved = {name: getattr(mc, name) for name in mc.GEOMETRY_PARAMETERS}
+    random.seed(seed)
+    # step generators are created only once the geometry is in place
+    cases = [(f"{n_dots} dots, {n_connection}-connected",
+              lambda n_dots=n_dots, n_connection=n_connection:
+                  mc.RepairingGenerator(n_dots, n_connection, rng=random.Random(seed)).steps())
+             for n_dots, n_connection in ((15, 0), (mc.NUM_REFERENCE_DOTS, 2))]
+    cases.append(("reference pool", lambda: mc._reference_pattern_steps(None, seed)))
+    failures = 0
+    mc.configure_geometry(**INFEASIBLE_GEOMETRY)
+    try:
+        for name, steps in cases:
+            result = _gives_up(steps())
+            if result is None:
+                failures += 1
+                print(f"{name}: no RuntimeError within {INFEASIBLE_TIME_LIMIT:.0f} s")
+            else:
+                print(f"{name}: RuntimeError after {result[0]:.2f} s ({result[1]})")
+    finally:
+        mc.configure_geometry(**saved)
+    print(f"infeasible: {len(cases)} cases, {failures} failures")
+    return failures == 0
+
+# -----------------------
+# MAIN
+# -----------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Brute-force cross-checks of the pattern generators and validator.")
+    sub = parser.add_subparsers(dest='check', required=True)
+    p = sub.add_parser('validator', help="validate_patterns against the brute-force rules on mutated patterns")
+    p.add_argument('--n', type=int, default=3000, help="mutated patterns")
+    p.add_argument('--seed', type=int, default=0)
+    p = sub.add_parser('symmetry', help="symmetry variants of generated pools against the brute-force rules")
+    p.add_argument('--sets', type=int, default=5, help="stimulus sets (master seeds seed, seed+1, ...)")
+    p.add_argument('--seed', type=int, default=0)
+    p = sub.add_parser('editor', help="2.py's PatternEditor-derived test patterns against the brute-force rules")
+    p.add_argument('--references', type=int, default=100, help="reference patterns per seed (21 derived patterns each)")
+    p.add_argument('--seeds', type=int, default=5, help="runs (random seeds seed, seed+1, ...)")
+    p.add_argument('--seed', type=int, default=0)
+    p = sub.add_parser('infeasible', help="generation under an infeasible geometry must raise RuntimeError")
+    p.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.check == 'validator':
+        ok = check_validator(args.n, args.seed)
+    elif args.check == 'symmetry':
+        ok = check_symmetry(args.sets, args.seed)
+    elif args.check == 'editor':
+        ok = check_editor(args.references, args.seeds, args.seed)
+    elif args.check == 'infeasible':
+        ok = check_infeasible(args.seed)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Feasibility sweep over the pattern geometry constants.
+
+For every point of a parameter grid (pattern size, dot spacing, line-dot clearance, line-length
+window, number of dots, number of connections) runs single generation attempts with the plain
+generators of merged_checked.py - generate_dots, generate_connecting_lines_from_dots and
+generate_free_lines, no retries - and records the success probability and the time per attempt.
+The expected time per accepted pattern is time per attempt / success probability. Points are
+evaluated in parallel, one point per work item.
+
+Usage:
+  python feasibility_sweep.py --size 160x240 240x320 --min-dot-distance 36 42 48 --dots 9 12 15 \\
+      --attempts 100 --jobs 8 --out feasibility.csv --heatmap n_dots min_dot_distance
+"""
+
+import argparse
+import csv
+import itertools
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import merged_checked as mc
+
+COLUMNS = ['width', 'height', 'min_dot_distance', 'min_line_dot_distance', 'min_line_length',
+           'max_line_length', 'n_dots', 'n_connection']
+HEATMAP_SHADES = " .:-=+*#%@"   # success probability 0 .. 1
+
+# -----------------------
+# One grid point (worker)
+# -----------------------
+def single_attempt(n_dots, n_connection):
+    """One pass of the plain generators; True if the whole pattern could be placed."""
+    try:
+        dots = mc.generate_dots(n_dots)
+    except RuntimeError:
+        return False
+    lines, pairs = mc.generate_connecting_lines_from_dots(dots, n_connection, [])
+    if len(pairs) < n_connection:
+        return False
+    try:
+        mc.generate_free_lines(mc.NUM_LINES - len(lines), dots, existing_lines=lines)
+    except RuntimeError:
+        return False
+    return True
+
+def evaluate_point(point, n_attempts, seed):
+    """point: dict with the COLUMNS keys. Returns the point extended with the measured statistics."""
+    random.seed(seed)
+    mc.configure_geometry(PATTERN_WIDTH=point['width'], PATTERN_HEIGHT=point['height'],
+                          MIN_DOT_DISTANCE=point['min_dot_distance'],
+                          MIN_LINE_DOT_DISTANCE=point['min_line_dot_distance'],
+                          MIN_LINE_LENGTH=point['min_line_length'], MAX_LINE_LENGTH=point['max_line_length'])
+    successes = 0
+    start = time.perf_counter()
+    for _ in range(n_attempts):
+        successes += single_attempt(point['n_dots'], point['n_connection'])
+    elapsed_ms = 1000.0 * (time.perf_counter() - start)
+    p = successes / n_attempts
+    result = dict(point)
+    result.update({
+        'attempts': n_attempts,
+        'p_success': p,
+        'ms_per_attempt': elapsed_ms / n_attempts,
+        'ms_per_pattern': elapsed_ms / successes if successes else float('inf'),
+    })
+    return result
+
+# -----------------------
+# Grid and reporting
+# -----------------------
+def parse_size(text):
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+def parse_window(text):
+    lo, hi = text.split(':')
+    return int(lo), int(hi)
+
+def grid_points(sizes, min_dot_distances, min_line_dot_distances, line_windows, dot_numbers, connections):
+    for (w, h), mdd, mldd, (lo, hi), n, c in itertools.product(sizes, min_dot_distances, min_line_dot_distances,
+                                                              line_windows, dot_numbers, connections):
+        yield {'width': w, 'height': h, 'min_dot_distance': mdd, 'min_line_dot_distance': mldd,
+               'min_line_length': lo, 'max_line_length': hi, 'n_dots': n, 'n_connection': c}
+
+def run_sweep(points, n_attempts, jobs=None, seed=None):
+    seeds = random.Random(seed).sample(range(2**31), len(points))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(evaluate_point, points, [n_attempts] * len(points), seeds))
+
+def format_table(results):
+    header = COLUMNS + ['p_success', 'ms_per_attempt', 'ms_per_pattern']
+    rows = [header] + [[str(r[c]) for c in COLUMNS] +
+                       [f"{r['p_success']:.3f}", f"{r['ms_per_attempt']:.2f}", f"{r['ms_per_pattern']:.2f}"]
+                       for r in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(w) for cell, w in zip(row, widths)) for row in rows)
+
+def format_heatmap(results, row_param, col_param):
+    """
+    ASCII heatmap of success probability over two parameters; each cell shows the worst case over
+    all other parameters, with the expected ms per pattern of that worst case.
+    """
+    rows = sorted({r[row_param] for r in results})
+    cols = sorted({r[col_param] for r in results})
+    worst = {}
+    for r in results:
+        key = (r[row_param], r[col_param])
+        if key not in worst or r['p_success'] < worst[key]['p_success']:
+            worst[key] = r
+    label_w = max(len(row_param), max(len(str(v)) for v in rows))
+    cell_w = max(12, max(len(f"{col_param}={c}") for c in cols) + 2)
+    lines = [f"success probability (worst case over other parameters): '{HEATMAP_SHADES}' = 0 .. 1",
+             f"{row_param:>{label_w}} | " + "".join(f"{col_param}={c}".ljust(cell_w) for c in cols)]
+    for rv in rows:
+        cells = []
+        for cv in cols:
+            r = worst.get((rv, cv))
+            if r is None:
+                cells.append("".ljust(cell_w))
+                continue
+            shade = HEATMAP_SHADES[min(len(HEATMAP_SHADES) - 1, int(r['p_success'] * len(HEATMAP_SHADES)))]
+            cost = "inf" if r['ms_per_pattern'] == float('inf') else f"{r['ms_per_pattern']:.0f}ms"
+            cells.append(f"{shade * 3} {cost}".ljust(cell_w))
+        lines.append(f"{str(rv):>{label_w}} | " + "".join(cells))
+    return "\n".join(lines)
+
+# -----------------------
+# MAIN
+# -----------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Map generator success rate and cost over the geometry parameters.")
+    parser.add_argument('--size', nargs='+', type=parse_size, default=[(mc.PATTERN_WIDTH, mc.PATTERN_HEIGHT)],
+                        help="pattern sizes WxH (default: merged_checked.py's)")
+    parser.add_argument('--min-dot-distance', nargs='+', type=int, default=[mc.MIN_DOT_DISTANCE])
+    parser.add_argument('--min-line-dot-distance', nargs='+', type=int, default=[mc.MIN_LINE_DOT_DISTANCE])
+    parser.add_argument('--line-length', nargs='+', type=parse_window,
+                        default=[(mc.MIN_LINE_LENGTH, mc.MAX_LINE_LENGTH)], help="line-length windows MIN:MAX")
+    parser.add_argument('--dots', nargs='+', type=int, default=sorted(set(mc.TEST_DOT_NUMBERS + [mc.NUM_REFERENCE_DOTS])))
+    parser.add_argument('--connections', nargs='+', type=int, default=mc.CONNECTEDNESS_LEVELS)
+    parser.add_argument('--attempts', type=int, default=50, help="generation attempts per grid point")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--out', default=None, help="write the full table as CSV here")
+    parser.add_argument('--heatmap', nargs=2, metavar=('ROW', 'COL'), choices=COLUMNS,
+                        default=['n_dots', 'min_dot_distance'], help="parameters on the heatmap axes")
+    args = parser.parse_args(argv)
+
+    points = list(grid_points(args.size, args.min_dot_distance, args.min_line_dot_distance,
+                              args.line_length, args.dots, args.connections))
+    start = time.perf_counter()
+    results = run_sweep(points, args.attempts, args.jobs, args.seed)
+    print(format_table(results))
+    print()
+    print(format_heatmap(results, *args.heatmap))
+    print(f"\n{len(points)} grid points x {args.attempts} attempts in {time.perf_counter() - start:.1f} s",
+          file=sys.stderr)
+    if args.out:
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS + ['attempts', 'p_success', 'ms_per_attempt', 'ms_per_pattern'])
+            writer.writeheader()
+            writer.writerows(results)
+
+if __name__ == "__main__":
+    main()
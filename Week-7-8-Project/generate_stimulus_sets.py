@@ -0,0 +1,163 @@
+"""
+Batch generation of per-participant stimulus sets.
+
+Generates N participant sets in parallel (one process per set at a time), each from its own seed,
+writes one pattern library file per participant (main pools plus the practice pool) with its
+feature index (pattern_features.py) next to it, and a manifest.json with per-set statistics.
+With --unique, no pattern may appear in more than one set (shared fingerprint index).
+With --oversample K, K times as many test candidates are generated and a confound-balanced subset
+is kept (pattern_selection.py).
+
+The files load directly into the experiment:
+  python generate_stimulus_sets.py 40 --out stimulus_sets --seed 1000 --unique
+  python merged_checked.py --participant 7 --library-dir stimulus_sets
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+
+import merged_checked as mc
+from pattern_features import FeatureIndex, features_path
+
+# -----------------------
+# Shared pattern index (cross-participant uniqueness)
+# -----------------------
+class SharedSignatureIndex:
+    """
+    Pattern-key set shared between worker processes through a multiprocessing manager. Entries are
+    stored by 64-bit fingerprint; full keys are compared on a fingerprint hit, so claims stay exact.
+    """
+    def __init__(self, manager):
+        self._seen = manager.dict()          # fingerprint -> pattern key
+        self._collisions = manager.dict()    # pattern key -> True, for keys whose fingerprint was taken
+        self._lock = manager.Lock()
+
+    def claim(self, key):
+        """Atomically register a pattern key; returns False if another set already owns it."""
+        fp = mc.key_fingerprint(key)
+        with self._lock:
+            stored = self._seen.get(fp)
+            if stored is None:
+                self._seen[fp] = key
+                return True
+            if stored == key or key in self._collisions:
+                return False
+            self._collisions[key] = True
+            return True
+
+    def __len__(self):
+        return len(self._seen) + len(self._collisions)
+
+POOLS = ('reference', 'test')
+
+def unique_pattern_count(paths):
+    """
+    Number of distinct patterns over all library files, from their stored fingerprints. Only a
+    fingerprint -> location map is held in memory; patterns whose fingerprints collide are reloaded
+    and compared by full key, so the count is exact.
+    """
+    def key_at(loc):
+        file_index, pool, i = loc
+        with open(paths[file_index]) as f:
+            return mc.pattern_key(mc._pattern_from_json(json.load(f)[POOLS[pool]][i]))
+
+    first = {}        # fingerprint -> (file index, pool index, pattern index) of its first occurrence
+    collided = {}     # fingerprint -> set of full keys seen under it
+    for file_index, path in enumerate(paths):
+        with open(path) as f:
+            lib = json.load(f)
+        fingerprints = mc.library_fingerprints(lib)
+        for pool, name in enumerate(POOLS):
+            for i, fp in enumerate(fingerprints[name]):
+                if fp not in first:
+                    first[fp] = (file_index, pool, i)
+                    continue
+                if fp not in collided:
+                    collided[fp] = {key_at(first[fp])}
+                collided[fp].add(mc.pattern_key(mc._pattern_from_json(lib[name][i])))
+    return len(first) + sum(len(keys) - 1 for keys in collided.values())
+
+# -----------------------
+# Per-set worker
+# -----------------------
+def set_statistics(reference_patterns, test_patterns):
+    cells = Counter((p['n_dots'], p['n_connection']) for p in test_patterns)
+    return {
+        'n_reference': len(reference_patterns),
+        'n_test': len(test_patterns),
+        'test_cells': {f"{n}_dots_{c}_conn": cells[(n, c)]
+                       for c in mc.CONNECTEDNESS_LEVELS for n in mc.TEST_DOT_NUMBERS},
+        'mean_test_line_length': sum(mc.distance(*l) for p in test_patterns for l in p['lines'])
+                                 / max(1, sum(len(p['lines']) for p in test_patterns)),
+    }
+
+def generate_set(participant_id, seed, out_dir, index=None, oversample=1):
+    random.seed(seed)
+    start = time.perf_counter()
+    claim = index.claim if index is not None else None
+    reference_patterns, test_patterns = mc.generate_all_patterns(claim, master_seed=seed, oversample=oversample)
+    practice_patterns = mc.generate_practice_patterns(master_seed=seed)
+    elapsed = time.perf_counter() - start
+    path = mc.library_path(out_dir, participant_id)
+    mc.save_pattern_library(path, reference_patterns, test_patterns, practice_patterns,
+                            participant_id=participant_id, seed=seed, oversample=oversample)
+    FeatureIndex.from_pools(reference=reference_patterns, test=test_patterns).save(features_path(path))
+    entry = {'participant_id': participant_id, 'seed': seed, 'file': os.path.basename(path),
+             'generation_seconds': round(elapsed, 3)}
+    entry.update(set_statistics(reference_patterns, test_patterns))
+    return entry
+
+# -----------------------
+# MAIN
+# -----------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate stimulus sets for many participants.")
+    parser.add_argument('n_sets', type=int, help="number of participant sets")
+    parser.add_argument('--out', default='stimulus_sets', help="output directory")
+    parser.add_argument('--first-id', type=int, default=1, help="participant id of the first set")
+    parser.add_argument('--seed', type=int, default=None, help="base seed; set i uses seed + i")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--unique', action='store_true', help="enforce global uniqueness across sets")
+    parser.add_argument('--oversample', type=int, default=mc.SELECTION_OVERSAMPLE,
+                        help="test candidates per selected pattern (>1: confound-balanced selection)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    base_seed = args.seed if args.seed is not None else random.randrange(2**31)
+    ids = [str(args.first_id + i) for i in range(args.n_sets)]
+    seeds = [base_seed + i for i in range(args.n_sets)]
+
+    start = time.perf_counter()
+    manager = Manager() if args.unique else None
+    index = SharedSignatureIndex(manager) if manager is not None else None
+    try:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(generate_set, pid, seed, args.out, index, args.oversample) for pid, seed in zip(ids, seeds)]
+            sets = []
+            for f in futures:
+                entry = f.result()
+                sets.append(entry)
+                print(f"participant {entry['participant_id']}: {entry['generation_seconds']:.1f} s")
+    finally:
+        if manager is not None:
+            manager.shutdown()
+
+    manifest = {
+        'base_seed': base_seed,
+        'globally_unique': args.unique,
+        'n_unique_patterns': unique_pattern_count([os.path.join(args.out, e['file']) for e in sets]),
+        'total_seconds': round(time.perf_counter() - start, 3),
+        'sets': sets,
+    }
+    with open(os.path.join(args.out, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {len(sets)} sets to {os.path.abspath(args.out)}")
+
+if __name__ == "__main__":
+    main()
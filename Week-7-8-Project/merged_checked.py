@@ -5,7 +5,15 @@ import random
 import math
 import copy
 import itertools
+import functools
+import hashlib
 import sys
+import os
+import json
+import argparse
+import time
+from array import array
+from collections import deque
 
 # -----------------------
 # DISPLAY & STIMULUS CONSTANTS
@@ -42,6 +50,7 @@ NUM_LINES = 4
 TEST_DOT_NUMBERS = [9,10,11,12,13,14,15]
 CONNECTEDNESS_LEVELS = [0,1,2]
 PATTERNS_PER_CONDITION = 8
+SELECTION_OVERSAMPLE = 1    # test candidates per selected pattern (>1: confound-balanced subset, pattern_selection.py)
 
 NUM_BLOCKS = 5
 TRIALS_PER_HALF_BLOCK = 168
@@ -51,6 +60,22 @@ PRACTICE_TEST_DOTS = 9
 
 HEMIFIELD_OFFSET = 200
 
+GEOMETRY_PARAMETERS = ('PATTERN_WIDTH', 'PATTERN_HEIGHT', 'MIN_DOT_DISTANCE', 'MIN_DOT_BOUNDARY_DISTANCE',
+                       'MIN_LINE_LENGTH', 'MAX_LINE_LENGTH', 'MIN_LINE_DOT_DISTANCE')
+
+def configure_geometry(**params):
+    """
+    Override geometry constants of this module (names from GEOMETRY_PARAMETERS), e.g. for parameter
+    sweeps, and recompute or drop the values derived from them (segment grid cell, clearance rasters).
+    """
+    global SEGMENT_GRID_CELL
+    for name, value in params.items():
+        if name not in GEOMETRY_PARAMETERS:
+            raise ValueError(f"not a geometry parameter: {name}")
+        globals()[name] = value
+    SEGMENT_GRID_CELL = MAX_LINE_LENGTH // 2
+    clearance_raster.cache_clear()
+
 # -----------------------
 # Geometry helpers
 # -----------------------
@@ -79,10 +104,82 @@ def point_to_segment_distance(point, seg_start, seg_end):
     cx = x1 + t*dx; cy = y1 + t*dy
     return math.hypot(px-cx, py-cy)
 
+# -----------------------
+# Segment index
+# Uniform grid over the pattern: every segment is registered in the cells its bounding box covers,
+# so an intersection query only tests segments sharing a cell with the candidate.
+# -----------------------
+SEGMENT_GRID_CELL = MAX_LINE_LENGTH // 2   # px (recomputed by configure_geometry)
+SEGMENT_GRID_SCAN = 8                      # up to this many segments a plain scan is cheaper than the grid
+
+class SegmentGrid:
+    """Set of line segments with grid-accelerated intersection and proximity queries."""
+    def __init__(self, lines=(), cell_size=None):
+        self.cell_size = cell_size if cell_size is not None else SEGMENT_GRID_CELL
+        self._lines = {}     # id -> segment
+        self._cells = {}     # (cx, cy) -> set of ids
+        self._ids = itertools.count()
+        for l in lines:
+            self.add(l)
+
+    def _cell_range(self, x_lo, y_lo, x_hi, y_hi):
+        c = self.cell_size
+        for cx in range(math.floor(x_lo / c), math.floor(x_hi / c) + 1):
+            for cy in range(math.floor(y_lo / c), math.floor(y_hi / c) + 1):
+                yield (cx, cy)
+
+    def _segment_cells(self, line):
+        (x1,y1),(x2,y2) = line
+        return self._cell_range(min(x1,x2), min(y1,y2), max(x1,x2), max(y1,y2))
+
+    def add(self, line):
+        i = next(self._ids)
+        self._lines[i] = line
+        for key in self._segment_cells(line):
+            self._cells.setdefault(key, set()).add(i)
+        return i
+
+    def remove(self, line):
+        """Remove one stored segment equal to line."""
+        for i, l in self._lines.items():
+            if l == line:
+                break
+        else:
+            raise ValueError("segment not in grid")
+        del self._lines[i]
+        for key in self._segment_cells(line):
+            self._cells[key].discard(i)
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __iter__(self):
+        return iter(list(self._lines.values()))
+
+    def _near_ids(self, cells):
+        ids = set()
+        for key in cells:
+            ids |= self._cells.get(key, set())
+        return ids
+
+    def intersects(self, line):
+        """True if line crosses any stored segment."""
+        if len(self._lines) <= SEGMENT_GRID_SCAN:
+            return any(lines_intersect(line, l) for l in self._lines.values())
+        return any(lines_intersect(line, self._lines[i]) for i in self._near_ids(self._segment_cells(line)))
+
+    def near(self, point, radius):
+        """Stored segments that may pass within radius of point (superset; check exactly)."""
+        if len(self._lines) <= SEGMENT_GRID_SCAN:
+            return list(self._lines.values())
+        x, y = point
+        ids = self._near_ids(self._cell_range(x - radius, y - radius, x + radius, y + radius))
+        return [self._lines[i] for i in ids]
+
 # -----------------------
 # Dot generation
 # -----------------------
-def generate_dots(n_dots, max_attempts=20000):
+def generate_dots(n_dots, max_attempts=20000, rng=random):
     dots = []
     attempts_total = 0
     # Domain for positions: centered at (0,0), coordinates in range [-W/2, W/2]
@@ -98,8 +195,8 @@ def generate_dots(n_dots, max_attempts=20000):
         placed = False
         while not placed and attempts_total < max_attempts:
             attempts_total += 1
-            x = random.randint(min_x, max_x)
-            y = random.randint(min_y, max_y)
+            x = rng.randint(min_x, max_x)
+            y = rng.randint(min_y, max_y)
 
             # Check min distance from already placed dots
             if all(distance((x,y),d) >= MIN_DOT_DISTANCE for d in dots):
@@ -109,36 +206,147 @@ def generate_dots(n_dots, max_attempts=20000):
             raise RuntimeError(f"Could not place dot {i+1}/{n_dots} after {max_attempts} attempts")
     return dots
 
+# -----------------------
+# Clearance raster for free-line sampling
+# One byte per integer position of the PATTERN_WIDTH x PATTERN_HEIGHT box (origin at the centre):
+# the distance to the nearest dot, truncated to a single level (blocked if the cell centre is closer
+# than MIN_LINE_DOT_DISTANCE - 1; a point rounding to such a cell is then closer than
+# MIN_LINE_DOT_DISTANCE). Start points are drawn from unblocked cells and candidate segments are
+# rejected by lookups along their length; segments that pass still get the exact dot-distance check,
+# so accepted lines are distributed exactly as with plain rejection sampling.
+# Building the raster costs about as much as placing all lines of a 15-dot pattern by plain sampling,
+# so it is only switched on once plain sampling keeps failing (tight constants, crowded patterns).
+# -----------------------
+CLEAR_BLOCKED = 0
+CLEAR_FREE = 1
+CLEARANCE_STEP = 2              # px between lookups along a candidate segment
+CLEARANCE_SWITCH_AFTER = 100    # failed plain candidates for one line before the raster is built
+
+class ClearanceRaster:
+    def __init__(self, dots):
+        self.width = PATTERN_WIDTH + 1
+        self.height = PATTERN_HEIGHT + 1
+        self.cells = bytearray([CLEAR_FREE]) * (self.width * self.height)
+        self._paint(dots, MIN_LINE_DOT_DISTANCE - 1, CLEAR_BLOCKED)
+
+    def _paint(self, dots, radius, value):
+        """Set every cell whose centre lies closer than radius to a dot (one slice per row)."""
+        fill = bytes([value])
+        spans = _disc_spans(radius)
+        for (x, y) in dots:
+            cx = x + PATTERN_WIDTH//2; cy = y + PATTERN_HEIGHT//2
+            if cx != int(cx) or cy != int(cy):
+                spans_xy = _disc_spans_at(radius, cx, cy)
+                cx = cy = 0
+            else:
+                spans_xy = spans
+                cx = int(cx); cy = int(cy)
+            for dy, lo, hi in spans_xy:
+                j = cy + dy
+                if 0 <= j < self.height:
+                    lo = max(0, cx + lo); hi = min(self.width - 1, cx + hi)
+                    if lo <= hi:
+                        row = j * self.width
+                        self.cells[row+lo:row+hi+1] = fill * (hi - lo + 1)
+
+    def value(self, x, y):
+        return self.cells[(int(round(y)) + PATTERN_HEIGHT//2) * self.width + int(round(x)) + PATTERN_WIDTH//2]
+
+    def sample_start(self, max_attempts=10000, rng=random):
+        """Uniform integer point outside the blocked cells, or None."""
+        for _ in range(max_attempts):
+            x = rng.randint(-PATTERN_WIDTH//2, PATTERN_WIDTH//2)
+            y = rng.randint(-PATTERN_HEIGHT//2, PATTERN_HEIGHT//2)
+            if self.cells[(y + PATTERN_HEIGHT//2) * self.width + x + PATTERN_WIDTH//2] != CLEAR_BLOCKED:
+                return x, y
+        return None
+
+    def segment_blocked(self, p1, p2):
+        """True if a lookup along the segment proves it passes too close to a dot."""
+        (x1, y1), (x2, y2) = p1, p2
+        n = int(distance(p1, p2) // CLEARANCE_STEP) + 1
+        for k in range(n + 1):
+            t = k / n
+            if self.value(x1 + t*(x2-x1), y1 + t*(y2-y1)) == CLEAR_BLOCKED:
+                return True
+        return False
+
+@functools.lru_cache(maxsize=None)
+def _disc_spans(radius):
+    """Row spans (dy, dx_lo, dx_hi) of the integer offsets strictly within radius of the origin."""
+    return _disc_spans_at(radius, 0, 0)
+
+def _disc_spans_at(radius, cx, cy):
+    """Row spans (j, i_lo, i_hi) of the integer cells strictly within radius of (cx, cy)."""
+    spans = []
+    for j in range(math.floor(cy - radius) + 1, math.ceil(cy + radius)):
+        dy = j - cy
+        half = math.sqrt(max(0.0, radius*radius - dy*dy))
+        lo = math.floor(cx - half) + 1
+        hi = math.ceil(cx + half) - 1
+        if lo <= hi:
+            spans.append((j, lo, hi))
+    return spans
+
+@functools.lru_cache(maxsize=64)
+def clearance_raster(dots):
+    """Cached ClearanceRaster for a dot set (dots as a tuple)."""
+    return ClearanceRaster(dots)
+
+def sample_free_line(dots, lines, raster=None, rng=random):
+    """
+    One candidate free line for the given dots and placed lines (a SegmentGrid), or None if the
+    candidate failed.
+    With a raster the start point comes from free space and the segment is pre-checked by lookups;
+    the exact checks always run last.
+    """
+    if raster is not None:
+        start = raster.sample_start(rng=rng)
+        if start is None:
+            return None
+        x1, y1 = start
+    else:
+        x1 = rng.randint(-PATTERN_WIDTH//2, PATTERN_WIDTH//2)
+        y1 = rng.randint(-PATTERN_HEIGHT//2, PATTERN_HEIGHT//2)
+    angle = rng.uniform(0, 2*math.pi)
+    length = rng.uniform(MIN_LINE_LENGTH, MAX_LINE_LENGTH)
+    x2 = x1 + length*math.cos(angle)
+    y2 = y1 + length*math.sin(angle)
+    # boundary check
+    if not (-PATTERN_WIDTH//2 <= x2 <= PATTERN_WIDTH//2 and -PATTERN_HEIGHT//2 <= y2 <= PATTERN_HEIGHT//2):
+        return None
+    new_line = ((x1,y1),(x2,y2))
+    if raster is not None and raster.segment_blocked(new_line[0], new_line[1]):
+        return None
+    # Must not intersect existing lines
+    if lines.intersects(new_line):
+        return None
+    # Must be MIN_LINE_DOT_DISTANCE from all dots (exact)
+    if any(point_to_segment_distance(d, new_line[0], new_line[1]) < MIN_LINE_DOT_DISTANCE for d in dots):
+        return None
+    return new_line
+
 # -----------------------
 # Free-line generation (must not intersect other lines, must be >=12px from any dot)
 # -----------------------
-def generate_free_lines(n_lines, dots, existing_lines=None, max_attempts_per_line=2000):
+def generate_free_lines(n_lines, dots, existing_lines=None, max_attempts_per_line=2000, rng=random):
     if existing_lines is None:
         existing_lines = []
     lines = list(existing_lines)
+    grid = SegmentGrid(lines)
+    raster = None
 
     for _ in range(n_lines):
         placed = False
         for attempt in range(max_attempts_per_line):
-            x1 = random.randint(-PATTERN_WIDTH//2, PATTERN_WIDTH//2)
-            y1 = random.randint(-PATTERN_HEIGHT//2, PATTERN_HEIGHT//2)
-            angle = random.uniform(0, 2*math.pi)
-            length = random.uniform(MIN_LINE_LENGTH, MAX_LINE_LENGTH)
-            x2 = x1 + length*math.cos(angle)
-            y2 = y1 + length*math.sin(angle)
-            # boundary check
-            if not (-PATTERN_WIDTH//2 <= x2 <= PATTERN_WIDTH//2 and -PATTERN_HEIGHT//2 <= y2 <= PATTERN_HEIGHT//2):
-                continue
-            new_line = ((x1,y1),(x2,y2))
-            # Must not intersect existing lines
-            if any(lines_intersect(new_line, l) for l in lines):
-                continue
-            # Must be MIN_LINE_DOT_DISTANCE from all dots
-            if any(point_to_segment_distance(d, new_line[0], new_line[1]) < MIN_LINE_DOT_DISTANCE for d in dots):
-                continue
-            lines.append(new_line)
-            placed = True
-            break
+            if attempt == CLEARANCE_SWITCH_AFTER and raster is None:
+                raster = clearance_raster(tuple(dots))
+            new_line = sample_free_line(dots, grid, raster, rng)
+            if new_line is not None:
+                lines.append(new_line)
+                grid.add(new_line)
+                placed = True
+                break
         if not placed:
             raise RuntimeError("Could not place a free line after many attempts")
     return lines
@@ -148,10 +356,11 @@ def generate_free_lines(n_lines, dots, existing_lines=None, max_attempts_per_lin
 # Ensure pair distance in [MIN_LINE_LENGTH, MAX_LINE_LENGTH],
 # does not intersect existing lines, and stays >= MIN_LINE_DOT_DISTANCE from other dots (except its endpoints).
 # -----------------------
-def generate_connecting_lines_from_dots(dots, n_connection, existing_lines=None, max_attempts=2000):
+def generate_connecting_lines_from_dots(dots, n_connection, existing_lines=None, max_attempts=2000, rng=random):
     if existing_lines is None:
         existing_lines = []
     connecting_lines = list(existing_lines)
+    grid = SegmentGrid(connecting_lines)
     connected_pairs = []
     available_indices = set(range(len(dots)))
 
@@ -163,14 +372,14 @@ def generate_connecting_lines_from_dots(dots, n_connection, existing_lines=None,
             attempts += 1
             if len(available_indices) < 2:
                 break
-            i1, i2 = random.sample(list(available_indices), 2)
+            i1, i2 = rng.sample(sorted(available_indices), 2)
             p1 = dots[i1]; p2 = dots[i2]
             d = distance(p1,p2)
             if not (MIN_LINE_LENGTH <= d <= MAX_LINE_LENGTH):
                 continue
             new_line = (p1,p2)
             # no intersection with existing lines
-            if any(lines_intersect(new_line, l) for l in connecting_lines):
+            if grid.intersects(new_line):
                 continue
             # For other dots, ensure not too close (note: endpoints are fine)
             other_indices = set(range(len(dots))) - {i1,i2}
@@ -183,6 +392,7 @@ def generate_connecting_lines_from_dots(dots, n_connection, existing_lines=None,
                 continue
             # Accept
             connecting_lines.append(new_line)
+            grid.add(new_line)
             connected_pairs.append((i1,i2))
             # remove those indices from available to prevent reusing a dot in another connection
             available_indices.remove(i1)
@@ -195,24 +405,422 @@ def generate_connecting_lines_from_dots(dots, n_connection, existing_lines=None,
     return connecting_lines, connected_pairs
 
 # -----------------------
-# Utilities for checking pattern equality and mirroring
+# Repair-based pattern generation
+# A failed placement does not throw the pattern away: only the dots or lines in conflict are
+# relocated and placement resumes. A full restart happens only after MAX_REPAIRS repairs, and after
+# MAX_RESTARTS restarts the geometry is taken to be infeasible (RuntimeError, as generate_dots raises).
+# Generation also runs as a step generator (RepairingGenerator.steps): each next() places one dot or
+# line or tries at most CANDIDATES_PER_STEP candidates, so it can be interleaved with presentation.
 # -----------------------
-def pattern_signature(pattern):
-    """A canonical signature to compare patterns: round coords to ints and sort lists"""
-    dots = tuple(sorted((int(round(x)), int(round(y))) for x,y in pattern['dots']))
-    lines = tuple(sorted(((int(round(l[0][0])),int(round(l[0][1]))),(int(round(l[1][0])),int(round(l[1][1])))) for l in pattern['lines']))
-    return (dots, lines)
+REPAIR_DOT_ATTEMPTS = 500     # candidate positions per dot before a repair
+REPAIR_LINE_ATTEMPTS = 300    # candidate segments per free line before a repair
+REPAIR_CONNECT_ATTEMPTS = 200 # candidate pairs per connection before a repair
+MAX_REPAIRS = 40              # repairs per pattern before a full restart
+MAX_RESTARTS = 10             # full restarts per pattern before giving up
+CANDIDATES_PER_STEP = 32      # candidates tried per generation step
 
-def mirror_pattern(pattern):
-    """Mirror pattern horizontally (x -> -x) keeping dots/lines same relative positions."""
-    mirrored = {
-        'dots': [(-x,y) for x,y in pattern['dots']],
-        'lines': [((-l[0][0], l[0][1]), (-l[1][0], l[1][1])) for l in pattern['lines']],
-        'pairs': [( (len(pattern['dots'])-1 - a), (len(pattern['dots'])-1 - b)) for (a,b) in pattern.get('pairs',[]) ],
+class GenerationStats:
+    """Running cost counters of the repair generator (candidates = dot positions / segments / pairs tried)."""
+    def __init__(self):
+        self.patterns = 0
+        self.candidates = 0
+        self.repairs = 0
+        self.restarts = 0
+        self.seconds = 0.0
+
+    def per_pattern(self):
+        n = max(1, self.patterns)
+        return {'candidates': self.candidates / n, 'repairs': self.repairs / n,
+                'restarts': self.restarts / n, 'ms': 1000.0 * self.seconds / n}
+
+class _RestartNeeded(RuntimeError):
+    pass
+
+class GenerationTimeout(RuntimeError):
+    """Raised by RepairingGenerator.generate when its deadline passes before a pattern is complete."""
+
+def run_steps(steps, deadline_ns=None):
+    """
+    Run a step generator to completion and return its return value. With deadline_ns
+    (time.perf_counter_ns) GenerationTimeout is raised at the first step boundary after the deadline.
+    """
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+        if deadline_ns is not None and time.perf_counter_ns() > deadline_ns:
+            raise GenerationTimeout("pattern generation deadline passed")
+
+class RepairingGenerator:
+    """
+    Builds one pattern with n_dots dots, n_connection connecting lines and NUM_LINES lines in total.
+    Dots are placed first, then connections, then free lines; every failure triggers a local repair
+    (relocate one conflicting dot, or pull out one placed free line) instead of a restart.
+    All randomness is drawn from rng, so a seeded random.Random reproduces the pattern exactly.
+    """
+    def __init__(self, n_dots, n_connection=0, stats=None, rng=random):
+        self.n_dots = n_dots
+        self.n_connection = n_connection
+        self.stats = stats if stats is not None else GenerationStats()
+        self.rng = rng
+        self.min_x = -PATTERN_WIDTH//2 + MIN_DOT_BOUNDARY_DISTANCE
+        self.max_x = PATTERN_WIDTH//2 - MIN_DOT_BOUNDARY_DISTANCE
+        self.min_y = -PATTERN_HEIGHT//2 + MIN_DOT_BOUNDARY_DISTANCE
+        self.max_y = PATTERN_HEIGHT//2 - MIN_DOT_BOUNDARY_DISTANCE
+        if self.min_x > self.max_x or self.min_y > self.max_y:
+            raise RuntimeError("Pattern bounds too small for boundary constraints")
+
+    def generate(self, deadline_ns=None):
+        """
+        Build the pattern. With deadline_ns (time.perf_counter_ns) generation gives up with
+        GenerationTimeout at the first step after the deadline.
+        """
+        return run_steps(self.steps(), deadline_ns)
+
+    def steps(self):
+        """generate() as a step generator: one small step per next(), returns the pattern."""
+        start = time.perf_counter()
+        restarts = 0
+        while True:
+            self.dots = []
+            self.free_lines = []
+            self.connecting_lines = []
+            self.grid = SegmentGrid()
+            self.pairs = []
+            self._repairs_left = MAX_REPAIRS
+            try:
+                yield from self._place_dots()
+                yield from self._connect()
+                yield from self._place_free_lines()
+            except _RestartNeeded:
+                self.stats.restarts += 1
+                restarts += 1
+                if restarts > MAX_RESTARTS:
+                    raise RuntimeError(f"Could not place a {self.n_dots}-dot, {self.n_connection}-connected "
+                                       f"pattern after {MAX_RESTARTS} restarts")
+                yield
+                continue
+            self.stats.patterns += 1
+            self.stats.seconds += time.perf_counter() - start
+            return {'dots': self.dots, 'lines': self.connecting_lines + self.free_lines,
+                    'pairs': self.pairs, 'n_dots': self.n_dots, 'n_connection': self.n_connection}
+
+    # --- constraint checks ---
+    def _dot_ok(self, pt, skip=None):
+        for i, d in enumerate(self.dots):
+            if i != skip and distance(pt, d) < MIN_DOT_DISTANCE:
+                return False
+        # a moved/new dot is never an endpoint of a connection, so every line must keep its distance
+        return all(point_to_segment_distance(pt, l[0], l[1]) >= MIN_LINE_DOT_DISTANCE
+                   for l in self.grid.near(pt, MIN_LINE_DOT_DISTANCE))
+
+    def _random_point(self):
+        return (self.rng.randint(self.min_x, self.max_x), self.rng.randint(self.min_y, self.max_y))
+
+    def _repair(self):
+        self._repairs_left -= 1
+        self.stats.repairs += 1
+        if self._repairs_left < 0:
+            raise _RestartNeeded()
+
+    def _paired(self):
+        return {i for pr in self.pairs for i in pr}
+
+    def _relocate_dot(self, i):
+        """Move dot i to a random valid position (step generator); returns False if none was found."""
+        for attempt in range(REPAIR_DOT_ATTEMPTS):
+            if attempt and attempt % CANDIDATES_PER_STEP == 0:
+                yield
+            self.stats.candidates += 1
+            pt = self._random_point()
+            if self._dot_ok(pt, skip=i):
+                self.dots[i] = pt
+                return True
+        return False
+
+    # --- stages (step generators) ---
+    def _place_dots(self):
+        while len(self.dots) < self.n_dots:
+            yield
+            for attempt in range(REPAIR_DOT_ATTEMPTS):
+                if attempt and attempt % CANDIDATES_PER_STEP == 0:
+                    yield
+                self.stats.candidates += 1
+                pt = self._random_point()
+                if self._dot_ok(pt):
+                    self.dots.append(pt)
+                    break
+            else:
+                # repair: claim the candidate with the fewest conflicts, evicting the dots in its way
+                self._repair()
+                best, best_conflicts = None, None
+                for _ in range(20):
+                    self.stats.candidates += 1
+                    pt = self._random_point()
+                    conflicts = [i for i, d in enumerate(self.dots) if distance(pt, d) < MIN_DOT_DISTANCE]
+                    if best is None or len(conflicts) < len(best_conflicts):
+                        best, best_conflicts = pt, conflicts
+                self.dots = [d for i, d in enumerate(self.dots) if i not in best_conflicts] + [best]
+
+    def _connect(self):
+        while len(self.pairs) < self.n_connection:
+            yield
+            used = self._paired()
+            free = [i for i in range(len(self.dots)) if i not in used]
+            placed = False
+            for attempt in range(REPAIR_CONNECT_ATTEMPTS):
+                if attempt and attempt % CANDIDATES_PER_STEP == 0:
+                    yield
+                self.stats.candidates += 1
+                i1, i2 = self.rng.sample(free, 2)
+                p1 = self.dots[i1]; p2 = self.dots[i2]
+                if not (MIN_LINE_LENGTH <= distance(p1, p2) <= MAX_LINE_LENGTH):
+                    continue
+                new_line = (p1, p2)
+                if self.grid.intersects(new_line):
+                    continue
+                if any(point_to_segment_distance(self.dots[oi], p1, p2) < MIN_LINE_DOT_DISTANCE
+                       for oi in range(len(self.dots)) if oi != i1 and oi != i2):
+                    continue
+                self.connecting_lines.append(new_line)
+                self.grid.add(new_line)
+                self.pairs.append((i1, i2))
+                placed = True
+                break
+            if not placed:
+                # repair: relocate one unconnected dot, keeping everything else
+                self._repair()
+                yield from self._relocate_dot(self.rng.choice(free))
+
+    def _place_free_lines(self):
+        while len(self.connecting_lines) + len(self.free_lines) < NUM_LINES:
+            yield
+            raster = None
+            placed = False
+            for attempt in range(REPAIR_LINE_ATTEMPTS):
+                if attempt and attempt % CANDIDATES_PER_STEP == 0:
+                    yield
+                self.stats.candidates += 1
+                if attempt == CLEARANCE_SWITCH_AFTER:
+                    raster = clearance_raster(tuple(self.dots))
+                new_line = sample_free_line(self.dots, self.grid, raster, self.rng)
+                if new_line is not None:
+                    self.free_lines.append(new_line)
+                    self.grid.add(new_line)
+                    placed = True
+                    break
+            if not placed:
+                # repair: pull out one placed free line (it is re-placed later) or, with none placed,
+                # relocate one unconnected dot to open up space
+                self._repair()
+                if self.free_lines:
+                    self.grid.remove(self.free_lines.pop(self.rng.randrange(len(self.free_lines))))
+                else:
+                    used = self._paired()
+                    yield from self._relocate_dot(self.rng.choice([i for i in range(len(self.dots)) if i not in used]))
+
+def generate_pattern(n_dots, n_connection=0, stats=None, deadline_ns=None, rng=random):
+    """One pattern via RepairingGenerator; pass a GenerationStats to accumulate its cost."""
+    return RepairingGenerator(n_dots, n_connection, stats, rng).generate(deadline_ns)
+
+def _generate_pattern_restart(n_dots, n_connection=0):
+    """The old strategy (any failure discards the whole pattern); kept as the cost baseline."""
+    while True:
+        try:
+            dots = generate_dots(n_dots)
+            lines, pairs = generate_connecting_lines_from_dots(dots, n_connection, [])
+            if len(pairs) < n_connection:
+                continue
+            lines += generate_free_lines(NUM_LINES - len(lines), dots, existing_lines=lines)
+            return {'dots': dots, 'lines': lines, 'pairs': pairs, 'n_dots': n_dots, 'n_connection': n_connection}
+        except RuntimeError:
+            continue
+
+def generation_cost_report(n_patterns=50, dot_numbers=None, connectedness_levels=None):
+    """
+    Expected cost per accepted pattern of each strategy (restart vs repair), measured by generating
+    n_patterns patterns per condition with both. Returns the report as text.
+    """
+    dot_numbers = dot_numbers or [NUM_REFERENCE_DOTS] + [n for n in TEST_DOT_NUMBERS if n != NUM_REFERENCE_DOTS]
+    connectedness_levels = connectedness_levels or CONNECTEDNESS_LEVELS
+    rows = [f"{'dots':>4} {'conn':>4} {'restart ms':>10} {'repair ms':>9} {'candidates':>10} {'repairs':>7} {'restarts':>8}"]
+    for n_dots in sorted(dot_numbers):
+        for n_connection in connectedness_levels:
+            start = time.perf_counter()
+            for _ in range(n_patterns):
+                _generate_pattern_restart(n_dots, n_connection)
+            restart_ms = 1000.0 * (time.perf_counter() - start) / n_patterns
+            stats = GenerationStats()
+            for _ in range(n_patterns):
+                generate_pattern(n_dots, n_connection, stats)
+            c = stats.per_pattern()
+            rows.append(f"{n_dots:>4} {n_connection:>4} {restart_ms:>10.2f} {c['ms']:>9.2f} "
+                        f"{c['candidates']:>10.0f} {c['repairs']:>7.2f} {c['restarts']:>8.3f}")
+    return "\n".join(rows)
+
+# -----------------------
+# Pattern fingerprints
+# pattern_key packs a pattern's rounded, sorted dots and lines into a contiguous int16 buffer;
+# pattern_fingerprint hashes it to 64 bits. FingerprintIndex deduplicates on fingerprints and
+# compares the full keys only when two fingerprints collide, so it stays exact.
+# -----------------------
+def pattern_key(pattern):
+    """Exact canonical byte key of a pattern: counts, sorted dots, sorted lines as int16."""
+    dots = sorted((int(round(x)), int(round(y))) for x,y in pattern['dots'])
+    lines = sorted((int(round(a[0])), int(round(a[1])), int(round(b[0])), int(round(b[1]))) for a,b in pattern['lines'])
+    buf = array('h', (len(dots), len(lines)))
+    for d in dots:
+        buf.extend(d)
+    for l in lines:
+        buf.extend(l)
+    return buf.tobytes()
+
+def key_fingerprint(key):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+def pattern_fingerprint(pattern):
+    """64-bit hash of pattern_key."""
+    return key_fingerprint(pattern_key(pattern))
+
+class FingerprintIndex:
+    """Exact set of pattern keys stored by 64-bit fingerprint."""
+    def __init__(self):
+        self._keys = {}      # fingerprint -> key, or list of keys once fingerprints collide
+        self._n = 0
+
+    def add_key(self, key):
+        """Register key; returns False if it was already present."""
+        fp = key_fingerprint(key)
+        stored = self._keys.get(fp)
+        if stored is None:
+            self._keys[fp] = key
+        elif isinstance(stored, list):
+            if key in stored:
+                return False
+            stored.append(key)
+        elif stored == key:
+            return False
+        else:
+            self._keys[fp] = [stored, key]
+        self._n += 1
+        return True
+
+    def has_key(self, key):
+        stored = self._keys.get(key_fingerprint(key))
+        return stored == key or (isinstance(stored, list) and key in stored)
+
+    def add(self, pattern):
+        return self.add_key(pattern_key(pattern))
+
+    def __contains__(self, pattern):
+        return self.has_key(pattern_key(pattern))
+
+    def __len__(self):
+        return self._n
+
+# Symmetry group of the pattern box (centred at the origin): every transform keeps all geometric
+# constraints (distances, boundaries, intersections), so each variant of a valid pattern is valid.
+SYMMETRY_TRANSFORMS = [(1, 1), (-1, 1), (1, -1), (-1, -1)]   # (sx, sy): identity, h-flip, v-flip, 180 deg rotation
+
+def transform_pattern(pattern, sx, sy):
+    """Apply (x, y) -> (sx*x, sy*y) to dots and lines. Dot order is kept, so pairs are unchanged."""
+    return {
+        'dots': [(sx*x, sy*y) for x,y in pattern['dots']],
+        'lines': [((sx*l[0][0], sy*l[0][1]), (sx*l[1][0], sy*l[1][1])) for l in pattern['lines']],
+        'pairs': list(pattern.get('pairs', [])),
         'n_dots': pattern['n_dots'],
         'n_connection': pattern['n_connection']
     }
-    return mirrored
+
+def mirror_pattern(pattern):
+    """Mirror pattern horizontally (x -> -x) keeping dots/lines same relative positions."""
+    return transform_pattern(pattern, -1, 1)
+
+def symmetry_variants(pattern):
+    """
+    The pattern and its distinct flips/rotation (duplicates from self-symmetric patterns removed),
+    as (index into SYMMETRY_TRANSFORMS, variant) pairs.
+    """
+    variants = []
+    seen = set()
+    for t, (sx, sy) in enumerate(SYMMETRY_TRANSFORMS):
+        v = transform_pattern(pattern, sx, sy)
+        key = pattern_key(v)
+        if key not in seen:
+            seen.add(key)
+            variants.append((t, v))
+    return variants
+
+def canonical_key(pattern):
+    """Key shared by all symmetry variants of a pattern (minimum pattern_key over the group)."""
+    return min(pattern_key(transform_pattern(pattern, sx, sy)) for sx, sy in SYMMETRY_TRANSFORMS)
+
+# -----------------------
+# Pattern ids and seed-only regeneration
+# Pool patterns draw all their randomness from private generation streams, random.Random instances
+# seeded from (master seed, stream name), so every pattern can be rebuilt from a short id:
+#   <master seed, hex>.<base stream>n<n_dots>[c<n_connection>][.<derivation stream>c<n_connection>][.v<transform>]
+# Base streams are r<i> (reference pools), b<i> (test pools), pr<i>/pt<i> (practice), all 0-connected,
+# and a<i> (on-demand patterns, generated with their connections directly); a derivation stream d<i>
+# replaced free lines with connecting lines; v<t> indexes SYMMETRY_TRANSFORMS.
+# E.g. '3ade68b1.b7n13.d20c2.v1' is the h-flip of the 2-connected derivation of test base 7 (13 dots).
+# -----------------------
+def new_master_seed():
+    return random.getrandbits(32)
+
+def pattern_rng(master_seed, stream):
+    """The private RNG of one generation stream (string seeds are hashed, so this is stable across runs)."""
+    return random.Random(f"{master_seed:08x}:{stream}")
+
+# Each builder has a *_steps twin, a step generator returning the same pattern (see run_steps).
+def generate_base_pattern(master_seed, stream, n_dots, n_connection=0, deadline_ns=None):
+    """
+    Pattern generated from its own stream (0-connected unless n_connection is given); the result
+    carries its id. deadline_ns: see run_steps.
+    """
+    return run_steps(generate_base_pattern_steps(master_seed, stream, n_dots, n_connection), deadline_ns)
+
+def generate_base_pattern_steps(master_seed, stream, n_dots, n_connection=0):
+    pattern = yield from RepairingGenerator(n_dots, n_connection, rng=pattern_rng(master_seed, stream)).steps()
+    pattern['id'] = f"{master_seed:08x}.{stream}n{n_dots}" + (f"c{n_connection}" if n_connection else "")
+    return pattern
+
+def derive_connected_pattern(base, stream, n_connection):
+    """Replace n_connection of base's free lines with connecting lines (RuntimeError if impossible)."""
+    return run_steps(derive_connected_pattern_steps(base, stream, n_connection))
+
+def derive_connected_pattern_steps(base, stream, n_connection):
+    master_seed = int(base['id'].split('.')[0], 16)
+    dots = [(x,y) for x,y in base['dots']]
+    free_lines = [((l[0][0],l[0][1]),(l[1][0],l[1][1])) for l in base['lines']]
+    lines, pairs = yield from replace_free_lines_steps(dots, free_lines, n_connection,
+                                                       rng=pattern_rng(master_seed, stream))
+    return {'dots': dots, 'lines': lines, 'pairs': pairs, 'n_dots': base['n_dots'],
+            'n_connection': n_connection, 'id': f"{base['id']}.{stream}c{n_connection}"}
+
+def regenerate_pattern(pattern_id):
+    """Rebuild a pattern from its id; the geometry is identical to the one generated originally."""
+    return run_steps(regenerate_pattern_steps(pattern_id))
+
+def regenerate_pattern_steps(pattern_id):
+    master, base, *steps = pattern_id.split('.')
+    stream, n_dots = base.split('n')
+    n_dots, _, n_connection = n_dots.partition('c')
+    pattern = yield from generate_base_pattern_steps(int(master, 16), stream, int(n_dots), int(n_connection or 0))
+    for step in steps:
+        if step[0] == 'v':
+            sx, sy = SYMMETRY_TRANSFORMS[int(step[1:])]
+            pattern = transform_pattern(pattern, sx, sy)
+        else:
+            stream, n_connection = step.split('c')
+            pattern = yield from derive_connected_pattern_steps(pattern, stream, int(n_connection))
+    pattern['id'] = pattern_id
+    return pattern
+
+def pattern_id(pattern):
+    """The pattern's id, or '' for patterns not generated from a stream."""
+    return pattern.get('id', '') if pattern is not None else ''
 
 # -----------------------
 # Pattern generation top-level:
@@ -222,49 +830,76 @@ def mirror_pattern(pattern):
 #     * 0-connected (base)
 #     * 1-connected: replace exactly one free line by a connecting line between an eligible pair of dots
 #     * 2-connected: replace exactly two free lines by two connecting lines (non-overlapping, eligible pairs)
-# - For each pattern, also generate mirrored version (x->-x)
-# - Ensure uniqueness across produced patterns and produce PATTERNS_PER_CONDITION distinct ones per condition.
+# - Every accepted pattern is augmented with its symmetry variants (h-flip, v-flip, 180 deg rotation),
+#   so one constraint-satisfying generation yields up to len(SYMMETRY_TRANSFORMS) stimuli
+# - Bases are unique up to symmetry (canonical_key); produced patterns are unique by pattern_key,
+#   and PATTERNS_PER_CONDITION distinct ones are produced per condition.
+# - Every base and derivation uses its own stream of master_seed, so patterns carry regenerable ids.
 # -----------------------
-def generate_all_reference_patterns():
-    """Generate TRIALS_PER_HALF_BLOCK reference patterns (0-connected), guaranteeing uniqueness."""
+def generate_all_reference_patterns(claim=None, master_seed=None):
+    """
+    Generate TRIALS_PER_HALF_BLOCK reference patterns (0-connected), guaranteeing uniqueness.
+    claim: optional callable(key) -> bool used to enforce uniqueness across participants, called
+    with each pattern's pattern_key (returns False if another set already owns the pattern).
+    master_seed: seed of the generation streams (drawn from the global random if not given).
+    """
+    return list(iter_reference_patterns(claim, master_seed))
+
+def iter_reference_patterns(claim=None, master_seed=None, ticks=False):
+    """
+    Generator version of generate_all_reference_patterns: yields each pattern once accepted.
+    With ticks=True it also yields None between small generation steps (as iter_test_patterns does).
+    """
+    for p in _reference_pattern_steps(claim, master_seed):
+        if p is not None or ticks:
+            yield p
+
+def _reference_pattern_steps(claim, master_seed):
+    if master_seed is None:
+        master_seed = new_master_seed()
     unique_patterns = []
-    signatures = set()
+    seen = FingerprintIndex()
+    orbits = FingerprintIndex()
     attempts = 0
     while len(unique_patterns) < TRIALS_PER_HALF_BLOCK:
         attempts += 1
         if attempts > TRIALS_PER_HALF_BLOCK * 1000:
             raise RuntimeError("Too many attempts to generate unique reference patterns; loosen constraints.")
-        # generate dots and free lines
-        try:
-            dots = generate_dots(NUM_REFERENCE_DOTS)
-            lines = generate_free_lines(NUM_LINES, dots)
-        except RuntimeError:
-            continue
-        p = {
-            'dots': dots,
-            'lines': lines,
-            'pairs': [],
-            'n_dots': NUM_REFERENCE_DOTS,
-            'n_connection': 0
-        }
-        sig = pattern_signature(p)
-        if sig in signatures:
+        # generate dots and free lines (repairing failed placements)
+        base = yield from generate_base_pattern_steps(master_seed, f"r{attempts}", NUM_REFERENCE_DOTS)
+        if not orbits.add_key(canonical_key(base)):
             continue
-        signatures.add(sig)
-        unique_patterns.append(p)
-    return unique_patterns
+        for t, p in symmetry_variants(base):
+            if len(unique_patterns) >= TRIALS_PER_HALF_BLOCK:
+                break
+            key = pattern_key(p)
+            if seen.has_key(key):
+                continue
+            if claim is not None and not claim(key):
+                continue
+            seen.add_key(key)
+            p['id'] = f"{base['id']}.v{t}"
+            unique_patterns.append(p)
+            yield p
 
-def replace_free_lines_with_connecting(dots, free_lines, n_connections):
+def replace_free_lines_with_connecting(dots, free_lines, n_connections, rng=random):
     """
     Attempt to replace n_connections of free_lines with connecting lines between dot centers.
     Returns new_lines, connected_pairs if success, else raises RuntimeError
     """
+    return run_steps(replace_free_lines_steps(dots, free_lines, n_connections, rng))
+
+def replace_free_lines_steps(dots, free_lines, n_connections, rng=random):
+    """replace_free_lines_with_connecting as a step generator (one attempt per step)."""
     # We'll attempt to find suitable dot pairs (length in range) that do not conflict.
     # Start from available free_lines list; we will remove as many free lines as we add connecting lines.
     max_attempts = 1000
     for attempt in range(max_attempts):
+        if attempt:
+            yield
         # Copy
         lines_copy = [l for l in free_lines]
+        grid = SegmentGrid(lines_copy)
         connected_lines = []
         connected_pairs = []
         used_dots = set()
@@ -274,7 +909,7 @@ def replace_free_lines_with_connecting(dots, free_lines, n_connections):
             found_pair = False
             pair_attempts = 0
             all_indices = list(range(len(dots)))
-            random.shuffle(all_indices)
+            rng.shuffle(all_indices)
             for i1 in all_indices:
                 if i1 in used_dots: 
                     continue
@@ -287,7 +922,7 @@ def replace_free_lines_with_connecting(dots, free_lines, n_connections):
                         continue
                     new_line = (p1,p2)
                     # must not intersect existing connecting_lines or free lines that remain
-                    if any(lines_intersect(new_line, l) for l in connected_lines + lines_copy):
+                    if grid.intersects(new_line):
                         continue
                     # must not come too close to other dots (except endpoints)
                     others = set(range(len(dots))) - {i1,i2}
@@ -300,6 +935,7 @@ def replace_free_lines_with_connecting(dots, free_lines, n_connections):
                         continue
                     # found candidate
                     connected_lines.append(new_line)
+                    grid.add(new_line)
                     connected_pairs.append((i1,i2))
                     used_dots.add(i1); used_dots.add(i2)
                     found_pair = True
@@ -315,7 +951,7 @@ def replace_free_lines_with_connecting(dots, free_lines, n_connections):
             # After finding a connecting line, remove one free line from lines_copy to represent replacement
             if lines_copy:
                 # pick a random free line to replace
-                lines_copy.pop(random.randrange(len(lines_copy)))
+                grid.remove(lines_copy.pop(rng.randrange(len(lines_copy))))
             else:
                 success = False
                 break
@@ -324,9 +960,11 @@ def replace_free_lines_with_connecting(dots, free_lines, n_connections):
             final_lines = lines_copy + connected_lines
             # last checks: ensure final_lines don't intersect among themselves and respect distance to dots
             ok = True
-            for a,b in itertools.combinations(final_lines,2):
-                if lines_intersect(a,b):
+            final_grid = SegmentGrid()
+            for l in final_lines:
+                if final_grid.intersects(l):
                     ok = False; break
+                final_grid.add(l)
             if not ok:
                 continue
             # ensure non-connecting lines are at least MIN_LINE_DOT_DISTANCE from dots
@@ -344,94 +982,142 @@ def replace_free_lines_with_connecting(dots, free_lines, n_connections):
             return final_lines, connected_pairs
     raise RuntimeError("Could not replace free lines with connecting lines after many attempts")
 
-def generate_all_test_patterns():
+def generate_all_test_patterns(claim=None, master_seed=None, oversample=SELECTION_OVERSAMPLE, reference_patterns=None):
     """
     For each connectedness level (0,1,2) and each dot number (9..15) produce PATTERNS_PER_CONDITION
     patterns. For connectedness>0, we derive patterns from 0-connected base configurations (reuse same dots)
     and mirror them as specified.
+    claim, master_seed: see generate_all_reference_patterns.
+    oversample: with oversample > 1, oversample * PATTERNS_PER_CONDITION candidates are generated per
+    condition and the PATTERNS_PER_CONDITION with confound features best matched to reference_patterns
+    are kept (pattern_selection.select_test_patterns).
     """
-    test_patterns = []
+    test_patterns = [p for p in iter_test_patterns(claim, master_seed, PATTERNS_PER_CONDITION * oversample)
+                     if p is not None]
+    if oversample > 1:
+        from pattern_selection import select_test_patterns
+        test_patterns = select_test_patterns(test_patterns, reference_patterns, PATTERNS_PER_CONDITION)
+    # Shuffle patterns before returning
+    random.shuffle(test_patterns)
+    return test_patterns
 
-    # Pre-generate a pool of base configurations for each n_dots
-    base_pool = {}  # key: n_dots -> list of base patterns (0-connected) sufficient to create derived ones
+def iter_test_patterns(claim=None, master_seed=None, per_condition=PATTERNS_PER_CONDITION):
+    """
+    Generator version of generate_all_test_patterns (condition order, unshuffled, no selection):
+    yields per_condition patterns per condition, each once accepted, and None as a progress tick
+    between small generation steps, so that callers can interleave other work.
+    """
+    generator = TestPatternGenerator(claim, master_seed, initial_bases=-(-per_condition // len(SYMMETRY_TRANSFORMS)))
+    # Pre-generate a pool of base configurations for each n_dots; each base yields up to
+    # len(SYMMETRY_TRANSFORMS) patterns per condition, more bases are added on demand
     for n_dots in TEST_DOT_NUMBERS:
-        base_list = []
-        signatures = set()
+        for _ in range(generator.initial_bases):
+            yield from generator.add_base_steps(n_dots)
+    # Now for each connectedness level, for each n_dots, derive patterns:
+    for n_connection in CONNECTEDNESS_LEVELS:
+        for n_dots in TEST_DOT_NUMBERS:
+            for _ in range(per_condition):
+                pattern = yield from generator.next_steps(n_dots, n_connection)
+                yield pattern
+
+class TestPatternGenerator:
+    """
+    Unique test patterns per condition (n_dots, n_connection), one at a time and in any order of
+    conditions. Each n_dots has a pool of 0-connected bases, unique up to symmetry; a condition walks
+    over the pool, derives a pattern from each base (the base itself for 0 connections) and takes its
+    new symmetry variants, and a base is added whenever a full pass produced nothing new.
+    """
+    def __init__(self, claim=None, master_seed=None, initial_bases=-(-PATTERNS_PER_CONDITION // len(SYMMETRY_TRANSFORMS))):
+        self.claim = claim
+        self.master_seed = master_seed if master_seed is not None else new_master_seed()
+        self.initial_bases = initial_bases
+        self.bases = {}          # n_dots -> list of base patterns (0-connected)
+        self.bases_added = 0
+        self._seen = FingerprintIndex()
+        self._orbits = FingerprintIndex()
+        self._base_streams = itertools.count(1)
+        self._derive_streams = itertools.count(1)
+        self._conditions = {}    # (n_dots, n_connection) -> pattern generator of that condition
+
+    def add_base(self, n_dots):
+        return run_steps(self.add_base_steps(n_dots))
+
+    def add_base_steps(self, n_dots):
         attempts = 0
-        needed = PATTERNS_PER_CONDITION # we'll create derived patterns per base; generate more if needed
-        while len(base_list) < needed:
+        while True:
             attempts += 1
-            if attempts > needed * 1000:
+            if attempts > PATTERNS_PER_CONDITION * 1000:
                 raise RuntimeError(f"Too many attempts generating base patterns for {n_dots} dots")
-            # generate dots placed with constraints
-            try:
-                dots = generate_dots(n_dots)
-                # start with NUM_LINES free lines
-                free_lines = generate_free_lines(NUM_LINES, dots)
-            except RuntimeError:
-                continue
-            p = {'dots': dots, 'lines': free_lines.copy(), 'pairs': [], 'n_dots': n_dots, 'n_connection': 0}
-            sig = pattern_signature(p)
-            if sig in signatures:
-                continue
-            signatures.add(sig)
-            base_list.append(p)
-        base_pool[n_dots] = base_list
+            # dots placed with constraints, NUM_LINES free lines (repairing failed placements)
+            p = yield from generate_base_pattern_steps(self.master_seed, f"b{next(self._base_streams)}", n_dots)
+            if self._orbits.add_key(canonical_key(p)):
+                self.bases.setdefault(n_dots, []).append(p)
+                self.bases_added += 1
+                return p
 
-    # Now for each connectedness level, for each n_dots, derive patterns:
-    for n_connection in CONNECTEDNESS_LEVELS:
-        for n_dots in TEST_DOT_NUMBERS:
-            # For each pattern replicate
-            created = 0
-            base_index = 0
-            # We'll derive up to PATTERNS_PER_CONDITION per condition
-            while created < PATTERNS_PER_CONDITION:
-                base = base_pool[n_dots][base_index % len(base_pool[n_dots])]
-                base_index += 1
-                # Work on a deep copy of the base dots to preserve base for reuse
-                dots = [ (x,y) for x,y in base['dots'] ]
-                free_lines = [ ((l[0][0],l[0][1]),(l[1][0],l[1][1])) for l in base['lines'] ]
-                if n_connection == 0:
-                    pattern = {'dots': dots, 'lines': free_lines.copy(), 'pairs': [], 'n_dots': n_dots, 'n_connection': 0}
-                    test_patterns.append(pattern)
-                    created += 1
-                    # add mirrored variant as long as we don't exceed required and it's unique
-                    if created < PATTERNS_PER_CONDITION:
-                        mirrored = mirror_pattern(pattern)
-                        test_patterns.append(mirrored)
-                        created += 1
-                    continue
+    def next(self, n_dots, n_connection):
+        """The next new pattern of the condition."""
+        return run_steps(self.next_steps(n_dots, n_connection))
+
+    def next_steps(self, n_dots, n_connection):
+        """next() as a step generator (yields None between steps, returns the pattern)."""
+        condition = (n_dots, n_connection)
+        if condition not in self._conditions:
+            self._conditions[condition] = self._condition_patterns(n_dots, n_connection)
+        while True:
+            pattern = next(self._conditions[condition])
+            if pattern is not None:
+                return pattern
+            yield
+
+    def _condition_patterns(self, n_dots, n_connection):
+        """Endless stream of the condition's new patterns, with None between generation steps."""
+        while len(self.bases.get(n_dots, ())) < self.initial_bases:
+            yield from self.add_base_steps(n_dots)
+        bases = self.bases[n_dots]
+        created = 0
+        base_index = 0
+        pass_start = 0        # created count at the start of the current pass over the bases
+        while True:
+            if base_index > len(bases) * 1000:
+                raise RuntimeError(f"Too many attempts deriving {n_connection}-connected patterns for {n_dots} dots")
+            if base_index and base_index % len(bases) == 0:
+                # a full pass without anything new: the bases are exhausted for this condition
+                if created == pass_start:
+                    yield from self.add_base_steps(n_dots)
+                pass_start = created
+            base = bases[base_index % len(bases)]
+            base_index += 1
+            if n_connection == 0:
+                pattern = base
+            else:
                 # For connectedness > 0: attempt to replace free lines with connecting lines
+                # (on copies of the base dots and lines, so the base is preserved for reuse)
                 try:
-                    final_lines, connected_pairs = replace_free_lines_with_connecting(dots, free_lines, n_connection)
+                    pattern = yield from derive_connected_pattern_steps(base, f"d{next(self._derive_streams)}", n_connection)
                 except RuntimeError:
                     # failed to derive from this base; skip to next base
                     continue
-                pattern = {'dots': dots, 'lines': final_lines, 'pairs': connected_pairs, 'n_dots': n_dots, 'n_connection': n_connection}
-                # ensure uniqueness relative to existing test_patterns for same condition
-                sig = pattern_signature(pattern)
-                if any(sig == pattern_signature(p) for p in test_patterns):
+            # the pattern and its symmetry variants, each unique relative to all test patterns
+            for t, variant in symmetry_variants(pattern):
+                key = pattern_key(variant)
+                if self._seen.has_key(key):
                     continue
-                test_patterns.append(pattern)
+                if self.claim is not None and not self.claim(key):
+                    continue
+                self._seen.add_key(key)
+                variant['id'] = f"{pattern['id']}.v{t}"
                 created += 1
-                # Mirrored variant (explicitly requested)
-                if created < PATTERNS_PER_CONDITION:
-                    mirrored = mirror_pattern(pattern)
-                    msig = pattern_signature(mirrored)
-                    if not any(msig == pattern_signature(p) for p in test_patterns):
-                        test_patterns.append(mirrored)
-                        created += 1
-            # end while for created per condition
-    # Shuffle patterns before returning
-    random.shuffle(test_patterns)
-    return test_patterns
+                yield variant
 
 # -----------------------
 # Top-level generation wrapper
 # -----------------------
-def generate_all_patterns():
-    reference_patterns = generate_all_reference_patterns()
-    test_patterns = generate_all_test_patterns()
+def generate_all_patterns(claim=None, master_seed=None, oversample=SELECTION_OVERSAMPLE):
+    if master_seed is None:
+        master_seed = new_master_seed()
+    reference_patterns = generate_all_reference_patterns(claim, master_seed)
+    test_patterns = generate_all_test_patterns(claim, master_seed, oversample, reference_patterns)
     # Shuffle both lists
     random.shuffle(reference_patterns)
     random.shuffle(test_patterns)
@@ -440,6 +1126,59 @@ def generate_all_patterns():
         raise RuntimeError("Not enough patterns generated for full half-block; adjust parameters")
     return reference_patterns, test_patterns
 
+# -----------------------
+# Pattern library files
+# Pre-generated stimulus sets (see generate_stimulus_sets.py) stored as JSON, one file per participant.
+# -----------------------
+def library_path(library_dir, participant_id):
+    return os.path.join(library_dir, f"patterns_{participant_id}.json")
+
+def _pattern_from_json(p):
+    return {
+        'dots': [tuple(d) for d in p['dots']],
+        'lines': [(tuple(l[0]), tuple(l[1])) for l in p['lines']],
+        'pairs': [tuple(pr) for pr in p['pairs']],
+        'n_dots': p['n_dots'],
+        'n_connection': p['n_connection'],
+        'id': p.get('id', '')
+    }
+
+def save_pattern_library(path, reference_patterns, test_patterns, practice_patterns=None, **info):
+    """
+    Write both pools to a JSON library file; extra keyword arguments are stored under 'info'.
+    practice_patterns, a (reference, test) pair from generate_practice_patterns, is stored alongside.
+    The 64-bit fingerprints of both pools are stored as hex strings for deduplication across libraries.
+    """
+    lib = {'info': info, 'reference': reference_patterns, 'test': test_patterns,
+           'fingerprints': {'reference': [f"{pattern_fingerprint(p):016x}" for p in reference_patterns],
+                            'test': [f"{pattern_fingerprint(p):016x}" for p in test_patterns]}}
+    if practice_patterns is not None:
+        lib['practice'] = {'reference': practice_patterns[0], 'test': practice_patterns[1]}
+    with open(path, 'w') as f:
+        json.dump(lib, f)
+
+def load_pattern_library(path):
+    """Return (reference_patterns, test_patterns) with coordinates restored to tuples."""
+    with open(path) as f:
+        lib = json.load(f)
+    return [_pattern_from_json(p) for p in lib['reference']], [_pattern_from_json(p) for p in lib['test']]
+
+def library_fingerprints(lib):
+    """{'reference': [...], 'test': [...]} fingerprints (ints) of a loaded library dict."""
+    if 'fingerprints' in lib:
+        return {pool: [int(h, 16) for h in lib['fingerprints'][pool]] for pool in ('reference', 'test')}
+    # libraries written before fingerprints were stored
+    return {pool: [pattern_fingerprint(_pattern_from_json(p)) for p in lib[pool]] for pool in ('reference', 'test')}
+
+def load_practice_patterns(path):
+    """Return the library's practice pool as (reference_patterns, test_patterns), or None if it has none."""
+    with open(path) as f:
+        lib = json.load(f)
+    if 'practice' not in lib:
+        return None
+    return ([_pattern_from_json(p) for p in lib['practice']['reference']],
+            [_pattern_from_json(p) for p in lib['practice']['test']])
+
 # -----------------------
 # Stimulus creation + preloading for performance
 # We'll create canvases (or pre-render images) ahead of the experiment to avoid delays.
@@ -503,19 +1242,215 @@ def create_trial_list(reference_patterns, test_patterns, block_num):
         t['trial_num'] = idx
     return full
 
+# -----------------------
+# Streaming pipeline
+# No patterns are materialized up front: a block is a shuffled schedule of (pair, half, side)
+# entries over all its trials, in the same order distribution as create_trial_list, and each
+# trial's patterns are built from its pair source only when a LookaheadBuffer pulls the trial.
+# The buffer keeps the next LOOKAHEAD_TRIALS trials built and their canvases rendered, one small
+# step at a time, so pattern memory stays flat whatever NUM_BLOCKS (see the pair sources for
+# what they keep per pair).
+# -----------------------
+LOOKAHEAD_TRIALS = 8     # trials built and rendered ahead of the current one
+
+class GeneratedPairSource:
+    """
+    Pairs generated live: the first time a pair is needed it gets a fresh reference pattern and a
+    test pattern of the next of the shuffled conditions (PATTERNS_PER_CONDITION per condition).
+    Only the ids are kept; every later use of the pair (its mirrored replay, later blocks) rebuilds
+    the patterns from them. Test patterns are taken as generated: SELECTION_OVERSAMPLE and the
+    confound-balanced selection (pattern_selection.py) only apply to library builds.
+    """
+    def __init__(self, master_seed=None):
+        self.master_seed = master_seed if master_seed is not None else new_master_seed()
+        self._references = iter_reference_patterns(master_seed=self.master_seed, ticks=True)
+        self._tests = TestPatternGenerator(master_seed=self.master_seed)
+        conditions = [(n_dots, n_connection) for n_connection in CONNECTEDNESS_LEVELS
+                      for n_dots in TEST_DOT_NUMBERS for _ in range(PATTERNS_PER_CONDITION)]
+        random.shuffle(conditions)
+        self._conditions = conditions[:TRIALS_PER_HALF_BLOCK]
+        self.n_pairs = len(self._conditions)
+        self.pair_ids = [None] * self.n_pairs   # (reference id, test id) of each pair once generated
+        self._generated = 0
+
+    def pair_steps(self, pair):
+        """Step generator returning the (reference, test) patterns of pair number `pair`."""
+        if self.pair_ids[pair] is not None:
+            reference_id, test_id = self.pair_ids[pair]
+            reference = yield from regenerate_pattern_steps(reference_id)
+            test = yield from regenerate_pattern_steps(test_id)
+            return reference, test
+        reference = next(self._references)
+        while reference is None:
+            yield
+            reference = next(self._references)
+        n_dots, n_connection = self._conditions[self._generated]
+        self._generated += 1
+        test = yield from self._tests.next_steps(n_dots, n_connection)
+        self.pair_ids[pair] = (reference['id'], test['id'])
+        return reference, test
+
+class LibraryPairSource:
+    """
+    Pairs from a pattern library file: its first TRIALS_PER_HALF_BLOCK (reference, test) entries.
+    The file is parsed whole once; the pairs are kept as parsed JSON and decoded when drawn.
+    """
+    def __init__(self, path):
+        with open(path) as f:
+            lib = json.load(f)
+        self._pairs = list(zip(lib['reference'], lib['test']))[:TRIALS_PER_HALF_BLOCK]
+        self.n_pairs = len(self._pairs)
+
+    def pair_steps(self, pair):
+        """Step generator returning the (reference, test) patterns of pair number `pair`."""
+        reference, test = self._pairs[pair]
+        yield
+        return _pattern_from_json(reference), _pattern_from_json(test)
+
+def block_schedule(n_pairs):
+    """
+    Presentation order of one block as [(pair, half, test_on_left)]: every pair once on a random
+    side (half 1) and once mirrored (half 2), shuffled over the whole block as in create_trial_list.
+    """
+    sides = [random.choice([True, False]) for _ in range(n_pairs)]
+    schedule = ([(pair, 1, sides[pair]) for pair in range(n_pairs)]
+                + [(pair, 2, not sides[pair]) for pair in range(n_pairs)])
+    random.shuffle(schedule)
+    return schedule
+
+def iter_block_trials(pair_source, block_num):
+    """
+    Trials of one block in block_schedule order, with their patterns built from pair_source when
+    the trial is pulled. Yields None between the small steps that build the patterns.
+    """
+    schedule = block_schedule(pair_source.n_pairs)
+    for trial_num, (pair, half, test_on_left) in enumerate(schedule, start=1):
+        ref_pattern, test_pattern = yield from pair_source.pair_steps(pair)
+        yield {
+            'block': block_num,
+            'half': half,
+            'trial_num': trial_num,
+            'reference_pattern': ref_pattern,
+            'test_pattern': test_pattern,
+            'test_on_left': test_on_left,
+            'num_dots': test_pattern['n_dots'],
+            'connectedness': test_pattern['n_connection'],
+            'is_practice': False
+        }
+
+def trial_canvas_keys(trial_info):
+    """[(cache key, pattern, x offset)] of the two canvases the trial presents."""
+    ref_p = trial_info['reference_pattern']
+    test_p = trial_info['test_pattern']
+    if ref_p is None or test_p is None:      # generated on demand at trial time
+        return []
+    left_pattern, right_pattern = (test_p, ref_p) if trial_info['test_on_left'] else (ref_p, test_p)
+    return [((pattern_key(left_pattern), 'L'), left_pattern, -HEMIFIELD_OFFSET),
+            ((pattern_key(right_pattern), 'R'), right_pattern, HEMIFIELD_OFFSET)]
+
+class LookaheadBuffer:
+    """
+    Iterates over a trial stream, keeping the next `size` trials built and their canvases rendered
+    in preload_cache. The stream may yield None between the steps that build a trial
+    (iter_block_trials). The canvases of a finished trial are dropped (unless a buffered trial uses
+    them), so the cache holds at most those of size + 1 trials. fill_steps() is a background work
+    item for ResponseCollector; a trial not ready when it comes up is finished on the spot.
+    """
+    def __init__(self, trials, preload_cache, size=LOOKAHEAD_TRIALS):
+        self._trials = iter(trials)
+        self.cache = preload_cache
+        self.size = size
+        self._ahead = deque()
+        self._current = None
+        self._done = False
+
+    def fill_steps(self):
+        """
+        Build and render trials until size trials are ready: each step renders one canvas or
+        advances the trial stream by one step (at most a few ms, see MAX_WORK_STEP_MS). The state
+        is re-read at every step, so any number of these may be scheduled or abandoned.
+        """
+        while True:
+            canvas = self._unrendered()
+            if canvas is not None:
+                key, pattern, offset = canvas
+                self.cache[key] = create_pattern_canvas(pattern, offset)
+            elif len(self._ahead) >= self.size or not self._pull_step():
+                return
+            yield
+
+    def fill(self):
+        for _ in self.fill_steps():
+            pass
+
+    def _unrendered(self):
+        """(cache key, pattern, x offset) of the first buffered canvas not rendered yet, or None."""
+        for trial_info in self._ahead:
+            for key, pattern, offset in trial_canvas_keys(trial_info):
+                if key not in self.cache:
+                    return key, pattern, offset
+        return None
+
+    def _pull_step(self):
+        """Advance the trial stream by one step; False once it is exhausted."""
+        if self._done:
+            return False
+        try:
+            trial_info = next(self._trials)
+        except StopIteration:
+            self._done = True
+            return False
+        if trial_info is not None:
+            self._ahead.append(trial_info)
+        return True
+
+    def _release(self, trial_info):
+        in_use = {key for t in self._ahead for key, _, _ in trial_canvas_keys(t)}
+        for key, _, _ in trial_canvas_keys(trial_info):
+            if key not in in_use:
+                self.cache.pop(key, None)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._current is not None:
+            self._release(self._current)
+            self._current = None
+        while not self._ahead:
+            if not self._pull_step():
+                raise StopIteration
+        self._current = self._ahead.popleft()
+        for key, pattern, offset in trial_canvas_keys(self._current):
+            if key not in self.cache:
+                self.cache[key] = create_pattern_canvas(pattern, offset)
+        return self._current
+
 # -----------------------
 # Practice trials
 # -----------------------
-def create_practice_trials():
+def generate_practice_patterns(n_trials=NUM_PRACTICE_TRIALS, master_seed=None):
+    """Practice pool: (reference_patterns, test_patterns), n_trials each; tests have PRACTICE_TEST_DOTS dots, no connections."""
+    return run_steps(practice_pattern_steps(n_trials, master_seed))
+
+def practice_pattern_steps(n_trials=NUM_PRACTICE_TRIALS, master_seed=None):
+    """generate_practice_patterns as a step generator."""
+    if master_seed is None:
+        master_seed = new_master_seed()
+    reference_patterns = []
+    test_patterns = []
+    for i in range(n_trials):
+        reference_patterns.append((yield from generate_base_pattern_steps(master_seed, f"pr{i}", NUM_REFERENCE_DOTS)))
+    for i in range(n_trials):
+        test_patterns.append((yield from generate_base_pattern_steps(master_seed, f"pt{i}", PRACTICE_TEST_DOTS)))
+    return reference_patterns, test_patterns
+
+def create_practice_trials(practice_patterns=None):
+    """Build the practice trials from a precomputed practice pool (generated here if not given)."""
+    if practice_patterns is None:
+        practice_patterns = generate_practice_patterns()
     trials = []
-    for i in range(NUM_PRACTICE_TRIALS):
-        test_pat = generate_test_pattern(PRACTICE_TEST_DOTS, 0) if 'generate_test_pattern' in globals() else None
-        # fallback: use generate_test_pattern function below (we'll implement generate_test_pattern quickly)
-        # but easier: create a small 9-dot pattern here using same functions
-        dots = generate_dots(PRACTICE_TEST_DOTS)
-        free_lines = generate_free_lines(NUM_LINES, dots)
-        test_pattern = {'dots': dots, 'lines': free_lines, 'pairs': [], 'n_dots': PRACTICE_TEST_DOTS, 'n_connection': 0}
-        ref_pattern = generate_reference_pattern()
+    for i, (ref_pattern, test_pattern) in enumerate(zip(*practice_patterns)):
         test_on_left = random.choice([True, False])
         trials.append({
             'block': 0,
@@ -530,64 +1465,480 @@ def create_practice_trials():
         })
     return trials
 
-# Small wrapper functions referencing earlier implemented functions (for usage in practice)
-def generate_reference_pattern():
-    # use generate_dots(NUM_REFERENCE_DOTS) + generate_free_lines
-    while True:
-        try:
-            dots = generate_dots(NUM_REFERENCE_DOTS)
-            lines = generate_free_lines(NUM_LINES, dots)
-            return {'dots': dots, 'lines': lines, 'pairs': [], 'n_dots': NUM_REFERENCE_DOTS, 'n_connection': 0}
-        except RuntimeError:
-            continue
-
-def generate_test_pattern(n_dots, n_connection):
-    while True:
-        try:
-            dots = generate_dots(n_dots)
-            lines = []
-            connected_pairs = []
-            if n_connection > 0:
-                # attempt to create some connecting lines first, using generate_connecting_lines_from_dots
-                lines_tmp, connected_pairs = generate_connecting_lines_from_dots(dots, n_connection, [])
-                lines.extend(lines_tmp)
-            # fill the remaining lines with free lines
-            n_free = NUM_LINES - len(lines)
-            if n_free > 0:
-                lines += generate_free_lines(n_free, dots, existing_lines=lines)
-            return {'dots': dots, 'lines': lines, 'pairs': connected_pairs, 'n_dots': n_dots, 'n_connection': n_connection}
-        except RuntimeError:
-            continue
-
 # -----------------------
 # Presentation helpers
 # -----------------------
-def present_pattern_pair(exp, left_canvas, right_canvas, fixation_cross):
+def present_pattern_pair(exp, left_canvas, right_canvas, fixation_cross, timeline=None):
     # Show fixation
     fixation_cross.present()
+    if timeline is not None:
+        timeline.mark(EV_FIXATION_ONSET)
     exp.clock.wait(300)
     # display canvases
     screen = stimuli.BlankScreen(colour=BACKGROUND_COLOR)
     left_canvas.plot(screen)
     right_canvas.plot(screen)
     screen.present()
+    if timeline is not None:
+        timeline.mark(EV_STIMULUS_ONSET)
     # keep for the duration
     exp.clock.wait(STIMULUS_DURATION)
     # blank
     stimuli.BlankScreen(colour=BACKGROUND_COLOR).present()
+    if timeline is not None:
+        timeline.mark(EV_STIMULUS_OFFSET)
+
+# -----------------------
+# Trial event timeline
+# Monotonic nanosecond timestamps of every trial stage, kept in a preallocated ring buffer and
+# flushed to <datafile>_timeline.csv at block breaks. Marks are taken right after each present()
+# returns, so stimulus_onset is the actual flip and RT can be measured from it.
+# -----------------------
+TIMELINE_EVENTS = ('iti_start', 'fixation_onset', 'stimulus_onset', 'stimulus_offset', 'response', 'data_written')
+EV_ITI_START, EV_FIXATION_ONSET, EV_STIMULUS_ONSET, EV_STIMULUS_OFFSET, EV_RESPONSE, EV_DATA_WRITTEN = range(len(TIMELINE_EVENTS))
+
+class TrialTimeline:
+    def __init__(self, capacity=2*TRIALS_PER_HALF_BLOCK + NUM_PRACTICE_TRIALS, clock_ns=time.perf_counter_ns):
+        """clock_ns: timestamp source (use the virtual clock in fast-forward mode)."""
+        self.capacity = capacity
+        self.clock_ns = clock_ns
+        n_events = len(TIMELINE_EVENTS)
+        self._ts = array('q', bytes(8 * capacity * n_events))
+        self._ids = array('q', bytes(8 * capacity * 2))  # (block, trial_num) per slot
+        self._row = 0
+        self._n_started = 0
+        self._n_flushed = 0
+        self.n_dropped = 0
+
+    def begin_trial(self, block, trial_num):
+        slot = self._n_started % self.capacity
+        n_events = len(TIMELINE_EVENTS)
+        self._row = slot * n_events
+        for i in range(n_events):
+            self._ts[self._row + i] = 0
+        self._ids[2*slot] = block
+        self._ids[2*slot + 1] = trial_num
+        self._n_started += 1
+
+    def mark(self, event):
+        self._ts[self._row + event] = self.clock_ns()
+
+    def set(self, event, t_ns):
+        self._ts[self._row + event] = t_ns
+
+    def get(self, event):
+        return self._ts[self._row + event]
+
+    def rt_from_onset(self):
+        """RT (ms) of the current trial measured from the actual stimulus onset."""
+        return (self._ts[self._row + EV_RESPONSE] - self._ts[self._row + EV_STIMULUS_ONSET]) / 1e6
+
+    def flush(self, path):
+        """Append all trials recorded since the last flush to a CSV file (oldest first)."""
+        start = self._n_flushed
+        if self._n_started - start > self.capacity:
+            # ring buffer wrapped before this flush: the oldest rows were overwritten
+            self.n_dropped += self._n_started - start - self.capacity
+            start = self._n_started - self.capacity
+        n_events = len(TIMELINE_EVENTS)
+        new_file = not os.path.exists(path)
+        with open(path, 'a') as f:
+            if new_file:
+                f.write(','.join(('block', 'trial_num') + TIMELINE_EVENTS) + '\n')
+            for k in range(start, self._n_started):
+                slot = k % self.capacity
+                row = self._ts[slot*n_events:(slot+1)*n_events]
+                f.write(f"{self._ids[2*slot]},{self._ids[2*slot+1]}," + ','.join(map(str, row)) + '\n')
+        self._n_flushed = self._n_started
+
+# -----------------------
+# Non-blocking response collection
+# Instead of blocking in exp.keyboard.wait, poll the event queue and, between polls, run scheduled
+# background work in bounded time slices. Keys are timestamped when the poll sees them, so a key
+# pressed during a work step is seen (and timestamped) only when the step returns: the RT error is
+# bounded by the longest step. Scheduled work must therefore keep every step under MAX_WORK_STEP_MS
+# (one canvas, one row...); the collector times each step and counts the ones over the limit.
+# -----------------------
+MAX_WORK_STEP_MS = 2.0
+
+def _call_once(fn):
+    fn()
+    yield
+
+class ResponseCollector:
+    def __init__(self, exp, slice_ms=1.0, max_step_ms=MAX_WORK_STEP_MS):
+        self.exp = exp
+        self.slice_ns = int(slice_ms * 1000000)
+        self.max_step_ns = int(max_step_ms * 1000000)
+        self._work = deque()
+        self.n_steps = 0
+        self.n_long_steps = 0         # steps longer than max_step_ms
+        self.longest_step_ns = 0
+
+    def schedule(self, work):
+        """Queue background work: a generator (one step per next()) or a plain callable (run once)."""
+        self._work.append(_call_once(work) if callable(work) else iter(work))
+
+    def run_pending(self, deadline_ns=None):
+        """Step queued work until the queue is empty or the deadline (perf_counter_ns) has passed."""
+        while self._work:
+            step_start = time.perf_counter_ns()
+            if deadline_ns is not None and step_start >= deadline_ns:
+                return
+            try:
+                next(self._work[0])
+            except StopIteration:
+                self._work.popleft()
+            step_ns = time.perf_counter_ns() - step_start
+            self.n_steps += 1
+            if step_ns > self.max_step_ns:
+                self.n_long_steps += 1
+            self.longest_step_ns = max(self.longest_step_ns, step_ns)
+
+    def wait(self, keys):
+        """
+        Like exp.keyboard.wait(keys), plus the arrival time: returns (key, rt in ms from the call,
+        perf_counter_ns timestamp at which the key was seen).
+        """
+        self.exp.keyboard.clear()
+        start = time.perf_counter_ns()
+        while True:
+            key = self.exp.keyboard.check(keys)
+            now = time.perf_counter_ns()
+            if key is not None:
+                return key, int(round((now - start) / 1000000)), now
+            if self._work:
+                self.run_pending(now + self.slice_ns)
+
+    def as_text(self):
+        """Step timing so far; the longest step bounds the RT error."""
+        return (f"Work during response waits: {self.n_steps} steps, longest {self.longest_step_ns / 1000000:.1f} ms, "
+                f"{self.n_long_steps} over the {self.max_step_ns / 1000000:.1f} ms limit")
+
+def prerender_trial_steps(trial_info, preload_cache):
+    """Background work item: render the trial's missing canvases into the cache, one per step."""
+    for pattern in (trial_info['reference_pattern'], trial_info['test_pattern']):
+        if pattern is None:      # generated on demand at trial time
+            continue
+        key = pattern_key(pattern)
+        for side, offset in (('L', -HEMIFIELD_OFFSET), ('R', HEMIFIELD_OFFSET)):
+            if (key, side) not in preload_cache:
+                preload_cache[(key, side)] = create_pattern_canvas(pattern, offset)
+                yield
+
+# -----------------------
+# Online session summary
+# Streaming aggregator fed by run_trial: running chose_test counts per (num_dots, connectedness)
+# cell and running RT statistics (Welford), all O(1) per trial. Used to spot disengaged participants.
+# -----------------------
+FAST_RT_THRESHOLD = 150  # ms; responses faster than this are counted as anticipations
+
+class OnlineSummary:
+    def __init__(self):
+        self.cells = {}  # (num_dots, connectedness) -> [n_trials, n_chose_test]
+        self.n_trials = 0
+        self.n_fast = 0
+        self.rt_mean = 0.0
+        self._rt_m2 = 0.0
+        self.rt_min = None
+        self.rt_max = None
+
+    def update(self, num_dots, connectedness, chose_test, rt):
+        cell = self.cells.get((num_dots, connectedness))
+        if cell is None:
+            cell = self.cells[(num_dots, connectedness)] = [0, 0]
+        cell[0] += 1
+        if chose_test:
+            cell[1] += 1
+        # Welford update for running mean / variance
+        self.n_trials += 1
+        delta = rt - self.rt_mean
+        self.rt_mean += delta / self.n_trials
+        self._rt_m2 += delta * (rt - self.rt_mean)
+        if self.rt_min is None or rt < self.rt_min:
+            self.rt_min = rt
+        if self.rt_max is None or rt > self.rt_max:
+            self.rt_max = rt
+        if rt < FAST_RT_THRESHOLD:
+            self.n_fast += 1
+
+    @property
+    def rt_sd(self):
+        if self.n_trials < 2:
+            return 0.0
+        return math.sqrt(self._rt_m2 / (self.n_trials - 1))
+
+    def p_chose_test(self, num_dots, connectedness):
+        n, k = self.cells.get((num_dots, connectedness), (0, 0))
+        return k / n if n else None
+
+    def as_text(self):
+        """Compact multi-line summary: P(chose test) table (rows: connectedness, cols: num_dots) + RT stats."""
+        if self.n_trials == 0:
+            return "No trials recorded yet."
+        lines = ["P(chose test)  " + " ".join(f"{n:>4}" for n in TEST_DOT_NUMBERS)]
+        for c in CONNECTEDNESS_LEVELS:
+            cells = []
+            for n in TEST_DOT_NUMBERS:
+                p = self.p_chose_test(n, c)
+                cells.append("   -" if p is None else f"{p:4.2f}")
+            lines.append(f"{c}-connected    " + " ".join(cells))
+        lines.append(f"trials={self.n_trials}  RT mean={self.rt_mean:.0f} sd={self.rt_sd:.0f} "
+                     f"min={self.rt_min} max={self.rt_max} ms  fast(<{FAST_RT_THRESHOLD}ms)={self.n_fast}")
+        return "\n".join(lines)
+
+# -----------------------
+# Simulated observer
+# Synthetic participant that replaces the keyboard for load tests and automatic data checks.
+# Choice: logistic in the test-reference dot difference, with connected lines lowering the
+# perceived numerosity of the test pattern (plus lapses). RT: ex-Gaussian (ms).
+# -----------------------
+class SimulatedObserver:
+    def __init__(self, slope=1.0, connectedness_bias=0.5, lapse_rate=0.02,
+                 rt_mu=450, rt_sigma=60, rt_tau=150, seed=None):
+        self.slope = slope
+        self.connectedness_bias = connectedness_bias
+        self.lapse_rate = lapse_rate
+        self.rt_mu = rt_mu
+        self.rt_sigma = rt_sigma
+        self.rt_tau = rt_tau
+        self.rng = random.Random(seed)
+
+    def p_chose_test(self, num_dots, connectedness):
+        diff = num_dots - NUM_REFERENCE_DOTS - self.connectedness_bias * connectedness
+        p = 1.0 / (1.0 + math.exp(-self.slope * diff))
+        return self.lapse_rate / 2 + (1 - self.lapse_rate) * p
+
+    def draw_rt(self):
+        rt = self.rng.gauss(self.rt_mu, self.rt_sigma) + self.rng.expovariate(1.0 / self.rt_tau)
+        return max(1, int(round(rt)))
+
+    def respond(self, trial_info):
+        """Return (key, rt) for a trial, in the same form as exp.keyboard.wait([K_LEFT, K_RIGHT])."""
+        chose_test = self.rng.random() < self.p_chose_test(trial_info['num_dots'], trial_info['connectedness'])
+        test_on_left = trial_info['test_on_left']
+        key = K_LEFT if chose_test == test_on_left else K_RIGHT
+        return key, self.draw_rt()
+
+    def wait_key(self, key):
+        """Stand-in for exp.keyboard.wait(key) on instruction screens."""
+        return key, self.draw_rt()
+
+def wait_for_key(exp, key, observer=None):
+    if observer is not None:
+        key, rt = observer.wait_key(key)
+        exp.clock.wait(rt)
+        return key, rt
+    return exp.keyboard.wait(key)
+
+# -----------------------
+# Fast-forward (headless) mode
+# Null video/audio backend plus a virtual clock: every exp.clock.wait advances virtual time instead
+# of sleeping, so trials run as fast as the CPU allows while data columns and timings stay the same.
+# configure_fast_forward() must be called before control.initialize (the backend is picked when the
+# display opens); the VirtualClock replaces exp.clock right after initialization.
+# -----------------------
+class VirtualClock(expyriment.misc.Clock):
+    """expyriment Clock (ms units) whose time only moves when wait() is called."""
+    def __init__(self):
+        super().__init__()
+        self._now = 0
+        self._stopwatch_start = 0
+
+    @property
+    def time(self):
+        return self._now
+
+    @property
+    def stopwatch_time(self):
+        return self._now - self._stopwatch_start
+
+    def reset_stopwatch(self):
+        self._stopwatch_start = self._now
+
+    def wait(self, waiting_time, callback_function=None, process_control_events=False, low_performance=False):
+        self._now += max(0, int(waiting_time))
+
+    def wait_seconds(self, time_sec, callback_function=None, process_control_events=False, low_performance=False):
+        self.wait(time_sec * 1000)
+
+def configure_fast_forward():
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    control.defaults.window_mode = True
+    control.defaults.opengl = 0
+    control.defaults.initialise_delay = 0
+    control.defaults.goodbye_delay = 0
+    control.defaults.audiosystem_autostart = False
+    control.defaults.auto_create_subject_id = True
+
+# -----------------------
+# On-demand generation
+# For adaptive designs (e.g. staircases on num_dots) the next pattern is not known in advance. A trial
+# can carry 'pattern_source' (an OnDemandGenerator) instead of a test/reference pattern; run_trial then
+# generates the missing patterns inside the ITI, under a hard budget per trial, falling back to a
+# reserve pool that is refilled after the ITI (during the response wait, or once the response is in).
+# -----------------------
+ON_DEMAND_BUDGET_MS = MIN_ITI // 2     # generation budget per trial; the rest of the ITI covers rendering
+ON_DEMAND_RESERVE_SIZE = 2             # reserve patterns per (n_dots, n_connection); >= requests per trial
+
+class OnDemandGenerator:
+    """
+    Returns a valid pattern for any (n_dots, n_connection) within a budget. Generation runs under a
+    deadline one step (MAX_WORK_STEP_MS) short of the budget; if it times out, a pattern of the
+    precomputed reserve is used instead, and if the reserve of the condition is empty the request
+    fails with GenerationTimeout rather than block. Refilling the reserve (refill_steps) is not part
+    of any request. Latency (ms), budget and source ('generated' / 'reserve' / 'failed') of every
+    request are recorded.
+    Every pattern is generated from its own stream a<i> of master_seed, so it carries an id that
+    regenerate_pattern rebuilds it from (a timed-out stream is simply skipped).
+    """
+    def __init__(self, budget_ms=ON_DEMAND_BUDGET_MS, reserve_size=ON_DEMAND_RESERVE_SIZE,
+                 dot_numbers=None, connectedness_levels=None, master_seed=None):
+        self.budget_ms = budget_ms
+        self.reserve_size = reserve_size
+        self.master_seed = master_seed if master_seed is not None else new_master_seed()
+        self._streams = itertools.count(1)
+        self.latencies_ms = []
+        self.budgets_ms = []
+        self.sources = []
+        dot_numbers = dot_numbers or sorted(set(TEST_DOT_NUMBERS + [NUM_REFERENCE_DOTS]))
+        self.reserve = {(n_dots, n_connection): [] for n_dots in dot_numbers
+                        for n_connection in (connectedness_levels or CONNECTEDNESS_LEVELS)}
+        self.refill()
+
+    def get(self, n_dots, n_connection=0, budget_ms=None):
+        """A pattern of the condition within budget_ms (default: the whole per-trial budget_ms)."""
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        start = time.perf_counter_ns()
+        pattern = None
+        source = 'reserve'
+        # the step that passes the deadline may take up to MAX_WORK_STEP_MS more
+        if budget_ms > MAX_WORK_STEP_MS:
+            try:
+                pattern = generate_base_pattern(self.master_seed, f"a{next(self._streams)}", n_dots, n_connection,
+                                                start + int((budget_ms - MAX_WORK_STEP_MS) * 1000000))
+                source = 'generated'
+            except GenerationTimeout:
+                pass
+        if pattern is None:
+            pool = self.reserve.get((n_dots, n_connection))
+            if pool:
+                pattern = pool.pop()
+            else:
+                source = 'failed'
+        self.latencies_ms.append((time.perf_counter_ns() - start) / 1000000)
+        self.budgets_ms.append(budget_ms)
+        self.sources.append(source)
+        if pattern is None:
+            raise GenerationTimeout(f"no {n_dots}-dot, {n_connection}-connected pattern within {budget_ms:.1f} ms "
+                                    "and none left in reserve")
+        return pattern
+
+    def refill_steps(self):
+        """Step generator topping the reserve back up to reserve_size patterns per condition."""
+        for key, pool in self.reserve.items():
+            while len(pool) < self.reserve_size:
+                pattern = yield from generate_base_pattern_steps(self.master_seed, f"a{next(self._streams)}", *key)
+                # another refill may have filled the slot meanwhile
+                if len(pool) < self.reserve_size:
+                    pool.append(pattern)
+
+    def refill(self):
+        run_steps(self.refill_steps())
+
+    def latency_summary(self):
+        """
+        Latency distribution of all requests so far: n, mean, p50, p95, p99, max (ms), reserve uses,
+        failed requests and requests over their budget.
+        """
+        lat = sorted(self.latencies_ms)
+        if not lat:
+            return {'n': 0}
+        def q(p):
+            return lat[min(len(lat) - 1, int(p * len(lat)))]
+        return {'n': len(lat), 'mean': sum(lat) / len(lat), 'p50': q(0.5), 'p95': q(0.95), 'p99': q(0.99),
+                'max': lat[-1], 'reserve_used': self.sources.count('reserve'), 'failed': self.sources.count('failed'),
+                'over_budget': sum(1 for x, b in zip(self.latencies_ms, self.budgets_ms) if x > b)}
+
+    def as_text(self):
+        s = self.latency_summary()
+        if not s['n']:
+            return "On-demand generation: no requests"
+        return (f"On-demand generation: {s['n']} requests, mean {s['mean']:.1f} ms, p50 {s['p50']:.1f}, "
+                f"p95 {s['p95']:.1f}, p99 {s['p99']:.1f}, max {s['max']:.1f} ms (budget {self.budget_ms} ms per trial); "
+                f"reserve used {s['reserve_used']}, failed {s['failed']}, over budget {s['over_budget']}")
+
+def fill_on_demand_patterns(trial_info):
+    """
+    Generate the trial's missing patterns from its 'pattern_source' (no-op for pregenerated trials).
+    The source's budget_ms covers the whole trial; each request gets an equal share of what is left.
+    """
+    source = trial_info.get('pattern_source')
+    if source is None:
+        return
+    requests = []
+    if trial_info.get('test_pattern') is None:
+        requests.append(('test_pattern', trial_info['num_dots'], trial_info['connectedness']))
+    if trial_info.get('reference_pattern') is None:
+        requests.append(('reference_pattern', NUM_REFERENCE_DOTS, 0))
+    deadline = time.perf_counter_ns() + int(source.budget_ms * 1000000)
+    for i, (field, n_dots, n_connection) in enumerate(requests):
+        share_ms = (deadline - time.perf_counter_ns()) / 1000000 / (len(requests) - i)
+        trial_info[field] = source.get(n_dots, n_connection, share_ms)
 
 # -----------------------
 # Run single trial (records data)
 # -----------------------
-def run_trial(exp, trial_info, fixation_cross, preload_cache):
+def run_trial(exp, trial_info, fixation_cross, preload_cache, summary=None, observer=None, timeline=None,
+              collector=None):
+    if timeline is not None:
+        timeline.begin_trial(trial_info.get('block', -1), trial_info.get('trial_num', -1))
+        timeline.mark(EV_ITI_START)
     iti = random.randint(MIN_ITI, MAX_ITI)
-    exp.clock.wait(iti)
+    if trial_info.get('pattern_source') is not None:
+        # adaptive trial: generate and render inside the ITI, then wait out the rest of it
+        iti_start = exp.clock.time
+        fill_on_demand_patterns(trial_info)
+        left_canvas, right_canvas = get_trial_canvases(trial_info, preload_cache)
+        exp.clock.wait(max(0, iti - (exp.clock.time - iti_start)))
+    else:
+        exp.clock.wait(iti)
+        left_canvas, right_canvas = get_trial_canvases(trial_info, preload_cache)
 
+    # present and wait for response
+    present_pattern_pair(exp, left_canvas, right_canvas, fixation_cross, timeline)
+    # wait for response (or let the simulated observer answer); rt counts from the blank screen
+    if observer is not None:
+        key, rt = observer.respond(trial_info)
+        exp.clock.wait(rt)
+        response_ns = None
+    elif collector is not None:
+        if trial_info.get('pattern_source') is not None:
+            collector.schedule(trial_info['pattern_source'].refill_steps())
+        key, rt, response_ns = collector.wait([K_LEFT, K_RIGHT])
+    else:
+        key, rt = exp.keyboard.wait([K_LEFT, K_RIGHT])
+        response_ns = None
+    if timeline is not None:
+        # the collector's arrival time when there is one (same perf_counter_ns clock), else now
+        if response_ns is not None:
+            timeline.set(EV_RESPONSE, response_ns)
+        else:
+            timeline.mark(EV_RESPONSE)
+    chose_test = record_response(exp, trial_info, key, rt, summary, timeline)
+    if trial_info.get('pattern_source') is not None:
+        # the reserve is full again before the next trial's ITI (whatever the response wait left over)
+        trial_info['pattern_source'].refill()
+    return chose_test
+
+def get_trial_canvases(trial_info, preload_cache):
+    """Return (left_canvas, right_canvas) for a trial, from the preload cache when available."""
     # Choose canvases from preload cache if available
     ref_p = trial_info['reference_pattern']
     test_p = trial_info['test_pattern']
-    # make signature keys for cache
-    # keying by signature + left/right
+    # make keys for cache
+    # keying by pattern_key + left/right
     left_offset = -HEMIFIELD_OFFSET
     right_offset = HEMIFIELD_OFFSET
     if trial_info['test_on_left']:
@@ -595,16 +1946,22 @@ def run_trial(exp, trial_info, fixation_cross, preload_cache):
     else:
         left_pattern = ref_p; right_pattern = test_p
     # create cache keys
-    left_key = (pattern_signature(left_pattern), 'L')
-    right_key = (pattern_signature(right_pattern), 'R')
+    left_key = (pattern_key(left_pattern), 'L')
+    right_key = (pattern_key(right_pattern), 'R')
     # obtain canvases (preloaded) or create on the fly if not present
     left_canvas = preload_cache.get(left_key) or create_pattern_canvas(left_pattern, left_offset)
     right_canvas = preload_cache.get(right_key) or create_pattern_canvas(right_pattern, right_offset)
+    return left_canvas, right_canvas
 
-    # present and wait for response
-    present_pattern_pair(exp, left_canvas, right_canvas, fixation_cross)
-    # wait for response
-    key, rt = exp.keyboard.wait([K_LEFT, K_RIGHT])
+def record_response(exp, trial_info, key, rt, summary=None, timeline=None):
+    """
+    Score the response, write the data row and feed the summary; returns chose_test.
+    With a timeline, the caller must already have marked EV_RESPONSE; rt_from_onset is taken from
+    the marks.
+    """
+    rt_from_onset = None
+    if timeline is not None:
+        rt_from_onset = round(timeline.rt_from_onset(), 3)
     choice_side = "left" if key == K_LEFT else "right"
     test_side = "left" if trial_info['test_on_left'] else "right"
     chose_test = (choice_side == test_side)
@@ -621,45 +1978,58 @@ def run_trial(exp, trial_info, fixation_cross, preload_cache):
         choice_side,
         test_side,
         chose_test,
-        rt
+        rt,
+        rt_from_onset,
+        pattern_id(trial_info.get('reference_pattern')),
+        pattern_id(trial_info.get('test_pattern'))
     ])
+    if timeline is not None:
+        timeline.mark(EV_DATA_WRITTEN)
+    if summary is not None and not trial_info.get('is_practice', False):
+        summary.update(trial_info.get('num_dots', -1), trial_info.get('connectedness', -1), chose_test, rt)
     return chose_test
 
 # -----------------------
 # Main experiment
 # -----------------------
-def run_experiment():
+def run_experiment(observer=None, fast_forward=False, participant_id=None, library_dir=None):
+    """
+    Run the full session. Pass a SimulatedObserver to replace all keyboard input.
+    fast_forward=True runs headless on virtual time (implies a SimulatedObserver if none is given).
+    With library_dir and participant_id the participant's pre-generated stimulus set is loaded
+    instead of generating patterns at startup. participant_id becomes the subject id, so it must
+    be an integer (or a string of one).
+    """
+    if fast_forward:
+        configure_fast_forward()
+        if observer is None:
+            observer = SimulatedObserver()
     exp = design.Experiment(name="Connectedness_Numerosity_Checked")
-    # define data column names for clarity
-    exp.data.add_variable_names([
-        'block','half','trial_num','num_dots','connectedness','phase','test_on_left',
-        'choice_side','test_side','chose_test','rt'
-    ])
     control.initialize(exp)
+    if fast_forward:
+        exp._clock = VirtualClock()
     # developer mode False for better timing in actual run; set True for debugging
     control.set_develop_mode(False)
 
-    # Generate patterns
-    print("Generating all patterns (this may take some time)...")
-    reference_patterns, test_patterns = generate_all_patterns()
-    print("Generation complete.")
-
-    # Preload canvases for faster presentation: store a limited cache (e.g., first N used patterns)
+    # Stream the pairs from this participant's pre-generated stimulus set, or generate them live
+    # as the trials need them (see Streaming pipeline)
+    practice_patterns = None
+    if library_dir is not None and participant_id is not None:
+        path = library_path(library_dir, participant_id)
+        pair_source = LibraryPairSource(path)
+        practice_patterns = load_practice_patterns(path)
+        print(f"Loaded stimulus set for participant {participant_id}.")
+    else:
+        if SELECTION_OVERSAMPLE > 1:
+            print(f"Warning: SELECTION_OVERSAMPLE={SELECTION_OVERSAMPLE} is ignored without a stimulus library; "
+                  "live generated test patterns are not confound-balanced.")
+        pair_source = GeneratedPairSource()
+    # Practice pool: from the library when it has one; the first trials are rendered before the instructions
+    if practice_patterns is None:
+        practice_patterns = generate_practice_patterns()
     preload_cache = {}
-    # Preload for the first TRIALS_PER_HALF_BLOCK patterns as they will be used in block 1
-    for i in range(TRIALS_PER_HALF_BLOCK):
-        # ref left/right versions
-        ref = reference_patterns[i]
-        test = test_patterns[i]
-        # create canvases both positions (L/R)
-        key_ref_L = (pattern_signature(ref),'L'); key_ref_R = (pattern_signature(ref),'R')
-        key_test_L = (pattern_signature(test),'L'); key_test_R = (pattern_signature(test),'R')
-        if key_ref_L not in preload_cache:
-            preload_cache[key_ref_L] = create_pattern_canvas(ref, -HEMIFIELD_OFFSET)
-            preload_cache[key_ref_R] = create_pattern_canvas(ref, HEMIFIELD_OFFSET)
-        if key_test_L not in preload_cache:
-            preload_cache[key_test_L] = create_pattern_canvas(test, -HEMIFIELD_OFFSET)
-            preload_cache[key_test_R] = create_pattern_canvas(test, HEMIFIELD_OFFSET)
+    practice_trials = LookaheadBuffer(create_practice_trials(practice_patterns), preload_cache)
+    practice_trials.fill()
 
     # Instructions and fixation
     instructions = stimuli.TextScreen("Numerosity Judgment Task", text="""You will see two patterns of dots flash briefly on the screen.
@@ -677,35 +2047,80 @@ Press SPACE to begin practice.""")
     fixation_cross = stimuli.FixCross(size=(20,20), colour=C_GREEN, line_width=2)
     fixation_cross.preload()
 
-    # Start
-    control.start(skip_ready_screen=True)
+    # Start (a simulated observer cannot type a subject id)
+    if participant_id is not None:
+        control.start(skip_ready_screen=True, subject_id=int(participant_id))
+    else:
+        control.start(skip_ready_screen=True, auto_create_subject_id=(observer is not None) or None)
+    # define data column names for clarity (exp.data only exists once the experiment has started)
+    exp.data.add_variable_names([
+        'block','half','trial_num','num_dots','connectedness','phase','test_on_left',
+        'choice_side','test_side','chose_test','rt','rt_from_onset',
+        'reference_pattern_id','test_pattern_id'
+    ])
+    if fast_forward:
+        timeline = TrialTimeline(clock_ns=lambda: exp.clock.time * 1000000)
+    else:
+        timeline = TrialTimeline()
+    timeline_path = os.path.splitext(exp.data.fullpath)[0] + "_timeline.csv"
+    # real participants: render upcoming canvases while waiting for each response
+    collector = ResponseCollector(exp) if observer is None else None
     instructions.present()
-    exp.keyboard.wait(K_SPACE)
+    wait_for_key(exp, K_SPACE, observer)
 
     # Practice
-    practice_trials = create_practice_trials()
     stimuli.TextScreen("Practice", "Practice trials\n\nPress SPACE to start").present()
-    exp.keyboard.wait(K_SPACE)
+    wait_for_key(exp, K_SPACE, observer)
     for t in practice_trials:
-        run_trial(exp, t, fixation_cross, preload_cache)
+        if collector is not None:
+            collector.schedule(practice_trials.fill_steps())
+        run_trial(exp, t, fixation_cross, preload_cache, observer=observer, timeline=timeline, collector=collector)
+    timeline.flush(timeline_path)
 
     stimuli.TextScreen("Practice Complete", "Practice is complete!\n\nThe main experiment will now begin.\n\nPress SPACE to continue").present()
-    exp.keyboard.wait(K_SPACE)
+    wait_for_key(exp, K_SPACE, observer)
 
-    # Main blocks
+    # Main blocks: the first trials of a block are rendered while its start screen is shown
+    summary = OnlineSummary()
     for block_num in range(1, NUM_BLOCKS+1):
         stimuli.TextScreen(f"Block {block_num} of {NUM_BLOCKS}", f"Starting block {block_num}\n\nPress SPACE when ready").present()
-        exp.keyboard.wait(K_SPACE)
-        trials = create_trial_list(reference_patterns, test_patterns, block_num)
+        trials = LookaheadBuffer(iter_block_trials(pair_source, block_num), preload_cache)
+        trials.fill()
+        wait_for_key(exp, K_SPACE, observer)
         for t in trials:
-            run_trial(exp, t, fixation_cross, preload_cache)
+            if collector is not None:
+                collector.schedule(trials.fill_steps())
+            run_trial(exp, t, fixation_cross, preload_cache, summary, observer, timeline, collector)
+        timeline.flush(timeline_path)
+        # dump the running summary (and the background step timing) into the data file header
+        exp.data.add_experiment_info(f"Summary after block {block_num}:\n{summary.as_text()}")
+        if collector is not None:
+            exp.data.add_experiment_info(collector.as_text())
         if block_num < NUM_BLOCKS:
-            stimuli.TextScreen("Break Time", "Take a rest.\n\nPress SPACE when ready to continue").present()
-            exp.keyboard.wait(K_SPACE)
+            stimuli.TextScreen("Break Time", f"Take a rest.\n\n{summary.as_text()}\n\nPress SPACE when ready to continue").present()
+            wait_for_key(exp, K_SPACE, observer)
 
     stimuli.TextScreen("Experiment Complete", "Thank you for participating").present()
     exp.clock.wait(2000)
     control.end()
 
 if __name__ == "__main__":
-    run_experiment()
+    parser = argparse.ArgumentParser(description="Connectedness numerosity experiment")
+    parser.add_argument("--simulate", action="store_true",
+                        help="run the whole session with a synthetic participant (load tests, data checks)")
+    parser.add_argument("--fast-forward", action="store_true",
+                        help="run headless on virtual time (implies --simulate)")
+    parser.add_argument("--participant", type=int, default=None,
+                        help="participant (subject) id, an integer as numbered by generate_stimulus_sets.py")
+    parser.add_argument("--library-dir", default=None,
+                        help="directory of pre-generated stimulus sets (generate_stimulus_sets.py)")
+    parser.add_argument("--generation-report", action="store_true",
+                        help="print the expected generation cost of the restart and repair strategies and exit")
+    args = parser.parse_args()
+    if args.generation_report:
+        print(generation_cost_report())
+        sys.exit(0)
+    run_experiment(observer=SimulatedObserver() if args.simulate else None,
+                   fast_forward=args.fast_forward,
+                   participant_id=args.participant,
+                   library_dir=args.library_dir)
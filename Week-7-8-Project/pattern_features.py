@@ -0,0 +1,235 @@
+"""
+Confound features of stimulus patterns and a columnar feature index for matched selection.
+
+For every pattern of a pool computes, in vectorized NumPy passes over padded (patterns, dots)
+arrays: convex hull area, density (dots per DENSITY_AREA px^2 of hull), mean nearest-neighbour
+distance between dots and total line length. The features of a pattern library (both pools) are
+stored as one .npz file of column arrays next to the library JSON, so selection queries such as
+"8 patterns per (n_dots, connectedness) with matched hull area" run without touching the geometry.
+
+Usage:
+  python pattern_features.py stimulus_sets/patterns_*.json
+  python pattern_features.py stimulus_sets/patterns_7.json --select 8 --match hull_area density
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import merged_checked as mc
+
+FEATURES = ('hull_area', 'density', 'mean_nn_distance', 'line_length')
+DENSITY_AREA = 10000.0     # density unit: dots per 100 x 100 px of hull
+POOL_CODES = {'reference': 0, 'test': 1}
+CHUNK_PATTERNS = 256       # patterns per hull pass (memory grows with chunk * max_dots^3)
+
+# -----------------------
+# PACKING
+# -----------------------
+def pack_points(patterns, field='dots'):
+    """
+    Padded coordinate array (patterns, max count, 2) of the dots (or line endpoints, field='lines',
+    shape (patterns, max count, 2, 2)), NaN-padded, plus the per-pattern counts.
+    """
+    counts = np.fromiter((len(p[field]) for p in patterns), dtype=np.int64, count=len(patterns))
+    width = int(counts.max(initial=0))
+    if field == 'dots':
+        per_item = 2
+        values = (c for p in patterns for d in p['dots'] for c in d)
+    else:
+        per_item = 4
+        values = (c for p in patterns for l in p['lines'] for pt in l for c in pt)
+    flat = np.fromiter(values, dtype=float, count=int(counts.sum()) * per_item).reshape(-1, per_item)
+    rows = np.repeat(np.arange(len(patterns)), counts)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(counts) - counts, counts)
+    out = np.full((len(patterns), width, per_item), np.nan)
+    out[rows, cols] = flat
+    if field == 'lines':
+        out = out.reshape(len(patterns), width, 2, 2)
+    return out, counts
+
+# -----------------------
+# FEATURES
+# -----------------------
+def hull_area(dots):
+    """
+    Convex hull area per pattern from padded dots (patterns, n, 2), by the edge test: the ordered
+    pair (i, j) is a counter-clockwise hull edge if no dot lies to its right and every dot on its
+    line lies within the segment (so collinear hull dots give one maximal edge). The area is the
+    shoelace sum over the hull edges.
+    """
+    areas = np.empty(len(dots))
+    n = dots.shape[1]
+    for lo in range(0, len(dots), CHUNK_PATTERNS):
+        d = dots[lo:lo + CHUNK_PATTERNS]
+        valid = ~np.isnan(d[..., 0])
+        # dot coordinates are integers, so float32 cross products are exact
+        x = np.nan_to_num(d[..., 0]).astype(np.float32); y = np.nan_to_num(d[..., 1]).astype(np.float32)
+        dx = x[:, None, :] - x[:, :, None]                     # (c, i, j): x_j - x_i
+        dy = y[:, None, :] - y[:, :, None]
+        cross = dx[..., :, None] * dy[..., None, :] - dy[..., :, None] * dx[..., None, :]   # (c, i, j, k)
+        edge = ~((cross < 0) & valid[:, None, None, :]).any(-1)
+        edge &= valid[:, :, None] & valid[:, None, :] & ~np.eye(n, dtype=bool)
+        # collinear dots beyond either end: the edge is not maximal
+        c, i, j, k = np.nonzero(edge[..., None] & (cross == 0) & valid[:, None, None, :])
+        along = dx[c, i, j] * dx[c, i, k] + dy[c, i, j] * dy[c, i, k]
+        outside = (along < 0) | (along > dx[c, i, j] ** 2 + dy[c, i, j] ** 2)
+        edge[c[outside], i[outside], j[outside]] = False
+        shoelace = x[:, :, None] * y[:, None, :] - x[:, None, :] * y[:, :, None]
+        areas[lo:lo + CHUNK_PATTERNS] = 0.5 * np.where(edge, shoelace, 0.0).sum((1, 2), dtype=np.float64)
+    return areas
+
+def mean_nn_distance(dots):
+    """Mean over dots of the distance to the nearest other dot, per pattern."""
+    diff = dots[:, :, None, :] - dots[:, None, :, :]
+    dist = np.sqrt((diff ** 2).sum(-1))
+    n = dots.shape[1]
+    dist[:, np.arange(n), np.arange(n)] = np.inf
+    dist = np.where(np.isnan(dist), np.inf, dist)
+    nearest = dist.min(-1)
+    nearest = np.where(np.isfinite(nearest), nearest, np.nan)
+    return np.nanmean(nearest, axis=1)
+
+def total_line_length(lines):
+    """Summed length of all lines (connecting and free) per pattern."""
+    seg = lines[:, :, 1, :] - lines[:, :, 0, :]
+    return np.nansum(np.sqrt((seg ** 2).sum(-1)), axis=1)
+
+def compute_features(patterns):
+    """Dict of FEATURES columns (float arrays, one entry per pattern)."""
+    if not patterns:
+        return {name: np.empty(0) for name in FEATURES}
+    dots, n_dots = pack_points(patterns, 'dots')
+    lines, _ = pack_points(patterns, 'lines')
+    area = hull_area(dots)
+    with np.errstate(divide='ignore'):
+        density = np.where(area > 0, n_dots * DENSITY_AREA / area, np.inf)
+    return {'hull_area': area, 'density': density, 'mean_nn_distance': mean_nn_distance(dots),
+            'line_length': total_line_length(lines)}
+
+# -----------------------
+# FEATURE INDEX
+# -----------------------
+def features_path(library_path):
+    """The feature index stored next to a library: patterns_7.json -> patterns_7.features.npz"""
+    return os.path.splitext(library_path)[0] + '.features.npz'
+
+class FeatureIndex:
+    """
+    Column arrays over the candidates of one or more pools: id, pool (POOL_CODES), position (index
+    in its pool list), n_dots, n_connection and the FEATURES. Row i describes one candidate.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_pools(cls, **pools):
+        """Index the given pools, e.g. FeatureIndex.from_pools(reference=ref, test=test)."""
+        parts = []
+        for name, patterns in pools.items():
+            cols = {'id': np.array([mc.pattern_id(p) for p in patterns], dtype=str),
+                    'pool': np.full(len(patterns), POOL_CODES[name], dtype=np.int8),
+                    'position': np.arange(len(patterns), dtype=np.int64),
+                    'n_dots': np.array([p['n_dots'] for p in patterns], dtype=np.int16),
+                    'n_connection': np.array([p['n_connection'] for p in patterns], dtype=np.int16)}
+            cols.update(compute_features(patterns))
+            parts.append(cols)
+        return cls({key: np.concatenate([c[key] for c in parts]) for key in parts[0]})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls({key: f[key] for key in f.files})
+
+    def save(self, path):
+        np.savez(path, **self.columns)
+
+    def __len__(self):
+        return len(self.columns['pool'])
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def rows(self, pool=None, n_dots=None, n_connection=None):
+        """Row indices of the candidates matching all given values."""
+        keep = np.ones(len(self), dtype=bool)
+        for key, value in (('pool', pool), ('n_dots', n_dots), ('n_connection', n_connection)):
+            if value is not None:
+                keep &= self.columns[key] == (POOL_CODES[value] if key == 'pool' else value)
+        return np.flatnonzero(keep)
+
+    def feature_matrix(self, features=FEATURES, rows=None):
+        """(rows, features) matrix of the named features."""
+        rows = slice(None) if rows is None else rows
+        return np.stack([self.columns[name][rows] for name in features], axis=1)
+
+    def select_matched(self, per_cell, match=('hull_area',), pool='test', cells=None, target=None):
+        """
+        per_cell rows of every (n_dots, n_connection) cell of the pool whose features are closest to
+        a common target (default: the median over the pool), distance in pool-standardized units.
+        Returns {cell: row indices}; cells with fewer candidates return all they have.
+        """
+        rows = self.rows(pool=pool)
+        x = self.feature_matrix(match, rows)
+        scale = x.std(0)
+        scale[scale == 0] = 1.0
+        target = np.median(x, 0) if target is None else np.asarray(target, dtype=float)
+        cost = (((x - target) / scale) ** 2).sum(1)
+        cell_code = self.columns['n_dots'][rows].astype(np.int64) * 1000 + self.columns['n_connection'][rows]
+        order = np.lexsort((cost, cell_code))
+        sorted_cells = cell_code[order]
+        starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+        rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        chosen = order[rank < per_cell]
+        selected = {}
+        for code in np.unique(cell_code[chosen]):
+            cell = (int(code // 1000), int(code % 1000))
+            if cells is None or cell in cells:
+                selected[cell] = rows[chosen[cell_code[chosen] == code]]
+        return selected
+
+def build_library_index(library_path):
+    """Compute and store the feature index of a library file; returns the FeatureIndex."""
+    with open(library_path) as f:
+        lib = json.load(f)
+    index = FeatureIndex.from_pools(**{pool: [mc._pattern_from_json(p) for p in lib[pool]] for pool in POOL_CODES})
+    index.save(features_path(library_path))
+    return index
+
+def cell_summary(index, selected, features=FEATURES):
+    """Text table: per selected cell the count and mean of each feature."""
+    lines = ["n_dots conn  n  " + "  ".join(f"{name:>16}" for name in features)]
+    for (n_dots, n_connection), rows in sorted(selected.items()):
+        means = index.feature_matrix(features, rows).mean(0)
+        lines.append(f"{n_dots:>6} {n_connection:>4} {len(rows):>2}  " + "  ".join(f"{m:>16.2f}" for m in means))
+    return "\n".join(lines)
+
+# -----------------------
+# MAIN
+# -----------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build feature indexes of pattern libraries and run matched selections.")
+    parser.add_argument('libraries', nargs='+', help="pattern library files (.json)")
+    parser.add_argument('--select', type=int, default=None, metavar='N',
+                        help="select N test patterns per (n_dots, connectedness) cell and print their feature means")
+    parser.add_argument('--match', nargs='+', choices=FEATURES, default=['hull_area'],
+                        help="features matched across cells by --select")
+    args = parser.parse_args(argv)
+
+    for path in args.libraries:
+        start = time.perf_counter()
+        index = build_library_index(path)
+        print(f"{features_path(path)}: {len(index)} patterns, {1000 * (time.perf_counter() - start):.0f} ms",
+              file=sys.stderr)
+        if args.select:
+            start = time.perf_counter()
+            selected = index.select_matched(args.select, args.match)
+            print(f"selection: {1000 * (time.perf_counter() - start):.1f} ms", file=sys.stderr)
+            print(cell_summary(index, selected))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Confound-balanced selection of test patterns from an oversampled candidate pool.
+
+Instead of keeping the first PATTERNS_PER_CONDITION patterns generated for every (n_dots,
+connectedness) cell, a larger candidate pool is generated and PATTERNS_PER_CONDITION patterns per
+cell are chosen so that every cell's mean confound features (MATCH_FEATURES by default, in
+candidate-standardized units) are as close as possible to the reference pool's means. All cells
+share that target, so minimizing the distance per cell also equalizes the cells among each other,
+and the problem separates into one small subset problem per cell.
+
+Not every feature set can be matched: density is n_dots / hull area and the nearest-neighbour
+distance shrinks with density, so across numerosities at most one of hull area and density (with
+line length) can match. The default matches hull area and line length; --match density line_length
+is the density-controlled alternative. With all features the solver only trades them off.
+
+Candidates are not all distinct in feature space: the symmetry variants (flips, rotation) of a
+pattern have identical features, and the connected derivations of one base share its dots (hull
+area, density, nearest-neighbour distance). An oversampled cell of k candidates therefore offers
+about k / len(SYMMETRY_TRANSFORMS) distinct feature vectors, and the selection may take several
+variants of the same pattern.
+
+Each cell is solved by local search: start from the candidates individually closest to the target
+(FeatureIndex.select_matched), then repeatedly apply the best single swap (chosen <-> unchosen) of
+the whole cell, evaluated for all pairs at once, until no swap improves the cell.
+
+Usage:
+  python pattern_selection.py --oversample 20 --seed 1
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+import merged_checked as mc
+from pattern_features import FEATURES, FeatureIndex
+
+MATCH_FEATURES = ('hull_area', 'line_length')    # features matched by default (see above)
+MAX_SWAPS = 500     # per cell; each swap strictly lowers the cell's cost, this is only a safeguard
+
+# -----------------------
+# SOLVER
+# -----------------------
+def swap_search(x, chosen, target, max_swaps=MAX_SWAPS):
+    """
+    Best-improvement swap local search for the k-subset of rows of x whose mean is closest to target.
+    x: (candidates, features), chosen: initial row indices. Returns (chosen rows, cost, swaps).
+    """
+    chosen = np.array(chosen)
+    k = len(chosen)
+    in_set = np.zeros(len(x), dtype=bool)
+    in_set[chosen] = True
+    total = x[chosen].sum(0)
+    goal = k * target
+    cost = ((total - goal) ** 2).sum()
+    swaps = 0
+    while swaps < max_swaps:
+        outside = np.flatnonzero(~in_set)
+        if not len(outside):
+            break
+        # residual after each swap (s out, o in): total - x_s + x_o - goal, for all (s, o) at once
+        residual = (total - goal)[None, None, :] - x[chosen][:, None, :] + x[outside][None, :, :]
+        new_cost = (residual ** 2).sum(-1)
+        s, o = np.unravel_index(np.argmin(new_cost), new_cost.shape)
+        if new_cost[s, o] >= cost - 1e-12:
+            break
+        cost = new_cost[s, o]
+        total += x[outside[o]] - x[chosen[s]]
+        in_set[chosen[s]] = False
+        in_set[outside[o]] = True
+        chosen[s] = outside[o]
+        swaps += 1
+    return chosen, float(cost) / (k * k), swaps
+
+def select_balanced(index, per_cell, features=MATCH_FEATURES, pool='test', target_pool='reference'):
+    """
+    per_cell rows of every (n_dots, n_connection) cell of the index's pool, matched to the mean
+    features of target_pool (of the whole pool if the index has no target_pool rows).
+    Returns ({cell: row indices}, {cell: final cost}).
+    """
+    rows = index.rows(pool=pool)
+    x_all = index.feature_matrix(features)
+    scale = x_all[rows].std(0)
+    scale[scale == 0] = 1.0
+    target_rows = index.rows(pool=target_pool)
+    target = x_all[target_rows if len(target_rows) else rows].mean(0)
+    z = (x_all - target) / scale
+    start = index.select_matched(per_cell, features, pool=pool, target=target)
+    selected = {}
+    costs = {}
+    for cell, initial in start.items():
+        cell_rows = index.rows(pool=pool, n_dots=cell[0], n_connection=cell[1])
+        position = {r: i for i, r in enumerate(cell_rows)}
+        chosen, costs[cell], _ = swap_search(z[cell_rows], [position[r] for r in initial], np.zeros(len(features)))
+        selected[cell] = cell_rows[np.sort(chosen)]
+    return selected, costs
+
+def select_test_patterns(candidates, reference_patterns=None, per_cell=mc.PATTERNS_PER_CONDITION, features=MATCH_FEATURES):
+    """
+    Choose per_cell of the test candidates per (n_dots, n_connection) cell, balanced against the
+    reference pool (or the candidates' own means without one). Returns the chosen patterns.
+    """
+    index = FeatureIndex.from_pools(reference=reference_patterns or [], test=candidates)
+    selected, _ = select_balanced(index, per_cell, features)
+    positions = index['position']
+    return [candidates[positions[r]] for cell in sorted(selected) for r in selected[cell]]
+
+# -----------------------
+# REPORTING
+# -----------------------
+def imbalance_table(index, selected, features=FEATURES, target_pool='reference'):
+    """Per cell: mean of each feature minus the target pool mean, in target-pool SD units."""
+    target = index.feature_matrix(features, index.rows(pool=target_pool))
+    mean, sd = target.mean(0), target.std(0)
+    sd[sd == 0] = 1.0
+    lines = ["n_dots conn  " + "  ".join(f"{name:>16}" for name in features)]
+    worst = np.zeros(len(features))
+    for (n_dots, n_connection), rows in sorted(selected.items()):
+        dev = (index.feature_matrix(features, rows).mean(0) - mean) / sd
+        worst = np.maximum(worst, np.abs(dev))
+        lines.append(f"{n_dots:>6} {n_connection:>4}  " + "  ".join(f"{d:>+16.3f}" for d in dev))
+    lines.append("max |dev|    " + "  ".join(f"{w:>16.3f}" for w in worst))
+    return "\n".join(lines)
+
+def generation_order(index, per_cell, pool='test'):
+    """The selection without optimization: the first per_cell candidates of each cell."""
+    return {(n, c): index.rows(pool=pool, n_dots=n, n_connection=c)[:per_cell]
+            for c in mc.CONNECTEDNESS_LEVELS for n in mc.TEST_DOT_NUMBERS}
+
+# -----------------------
+# MAIN
+# -----------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare generation-order and confound-balanced test pattern selection.")
+    parser.add_argument('--oversample', type=int, default=10, help="candidates generated per selected pattern")
+    parser.add_argument('--per-cell', type=int, default=mc.PATTERNS_PER_CONDITION)
+    parser.add_argument('--match', nargs='+', choices=FEATURES, default=list(MATCH_FEATURES),
+                        help="features to match (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    master_seed = mc.new_master_seed()
+    start = time.perf_counter()
+    reference = mc.generate_all_reference_patterns(master_seed=master_seed)
+    candidates = [p for p in mc.iter_test_patterns(master_seed=master_seed, per_condition=args.per_cell * args.oversample)
+                  if p is not None]
+    print(f"generated {len(candidates)} candidates in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+    index = FeatureIndex.from_pools(reference=reference, test=candidates)
+    start = time.perf_counter()
+    selected, _ = select_balanced(index, args.per_cell, args.match)
+    print(f"selection: {1000 * (time.perf_counter() - start):.0f} ms", file=sys.stderr)
+    print("Generation order (deviation from reference pool, SD units):")
+    print(imbalance_table(index, generation_order(index, args.per_cell), args.match))
+    print("\nBalanced selection:")
+    print(imbalance_table(index, selected, args.match))
+
+if __name__ == "__main__":
+    main()
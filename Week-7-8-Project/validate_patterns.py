@@ -0,0 +1,216 @@
+"""
+Bulk constraint validator for pattern libraries.
+
+Checks every pattern of one or more library files (pools 'reference', 'test' and 'practice') against
+the geometric rules of merged_checked.py, with array operations over chunks of NaN-padded patterns:
+
+  dot_count           number of dots equals n_dots
+  dot_spacing         dots at least MIN_DOT_DISTANCE apart
+  dot_boundary        dots at least MIN_DOT_BOUNDARY_DISTANCE inside the pattern box
+  line_count          NUM_LINES lines
+  line_boundary       line endpoints inside the pattern box
+  line_length         every line between MIN_LINE_LENGTH and MAX_LINE_LENGTH long
+  line_dot_clearance  every line at least MIN_LINE_DOT_DISTANCE from every dot, except the two
+                      dots a connecting line joins
+  line_intersection   no two lines cross
+  connections         n_connection disjoint pairs, each joined by exactly one line
+
+Violations are reported by pattern id (library pool and position for patterns without an id).
+The exit status is 1 if any pattern violates a rule.
+
+Usage:
+  python validate_patterns.py stimulus_sets/ --out violations.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import merged_checked as mc
+from pattern_features import pack_points
+
+RULES = ('dot_count', 'dot_spacing', 'dot_boundary', 'line_count', 'line_boundary', 'line_length',
+         'line_dot_clearance', 'line_intersection', 'connections')
+TOLERANCE = 1e-9           # px; float round-off allowed on distance and length limits
+CHUNK_PATTERNS = 8192
+
+# -----------------------
+# LOADING
+# -----------------------
+def find_libraries(paths):
+    """Expand directories into the library files they contain (non-recursive), keep files as given."""
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files.extend(os.path.join(p, name) for name in sorted(os.listdir(p)) if name.endswith('.json')
+                         and name != 'manifest.json')
+        else:
+            files.append(p)
+    return files
+
+def library_patterns(path):
+    """(labels, patterns) of every pool of a library file; labels are pattern ids or pool[index]."""
+    with open(path) as f:
+        lib = json.load(f)
+    pools = {name: lib[name] for name in ('reference', 'test') if name in lib}
+    if 'practice' in lib:
+        pools['practice'] = lib['practice']['reference'] + lib['practice']['test']
+    labels = []
+    patterns = []
+    for name, pool in pools.items():
+        for i, p in enumerate(pool):
+            p = mc._pattern_from_json(p)
+            labels.append(p['id'] or f"{name}[{i}]")
+            patterns.append(p)
+    return labels, patterns
+
+def pack_pairs(patterns):
+    """Padded pair index array (patterns, max pairs, 2), -1-padded, plus per-pattern pair counts."""
+    counts = np.fromiter((len(p['pairs']) for p in patterns), dtype=np.int64, count=len(patterns))
+    out = np.full((len(patterns), max(1, int(counts.max(initial=0))), 2), -1, dtype=np.int64)
+    flat = np.fromiter((i for p in patterns for pr in p['pairs'] for i in pr), dtype=np.int64,
+                       count=2 * int(counts.sum())).reshape(-1, 2)
+    rows = np.repeat(np.arange(len(patterns)), counts)
+    out[rows, np.arange(len(flat)) - np.repeat(np.cumsum(counts) - counts, counts)] = flat
+    return out, counts
+
+# -----------------------
+# RULES
+# -----------------------
+def check_chunk(patterns):
+    """{rule: bool array (patterns,), True where the pattern violates the rule}."""
+    n_pat = len(patterns)
+    dots, n_found = pack_points(patterns, 'dots')
+    lines, n_lines = pack_points(patterns, 'lines')
+    pairs, n_pairs = pack_pairs(patterns)
+    n_dots = np.array([p['n_dots'] for p in patterns])
+    n_connection = np.array([p['n_connection'] for p in patterns])
+    n = dots.shape[1]
+    line_ok = ~np.isnan(lines[..., 0, 0])                 # (P, L)
+    half_w = mc.PATTERN_WIDTH / 2; half_h = mc.PATTERN_HEIGHT / 2
+    out = {}
+
+    out['dot_count'] = n_found != n_dots
+    diff = dots[:, :, None, :] - dots[:, None, :, :]
+    dist = np.sqrt((diff ** 2).sum(-1))
+    close = dist < mc.MIN_DOT_DISTANCE - TOLERANCE        # NaN (padding) compares False
+    close[:, np.arange(n), np.arange(n)] = False
+    out['dot_spacing'] = close.any((1, 2))
+    inner_w = half_w - mc.MIN_DOT_BOUNDARY_DISTANCE + TOLERANCE
+    inner_h = half_h - mc.MIN_DOT_BOUNDARY_DISTANCE + TOLERANCE
+    out['dot_boundary'] = ((np.abs(dots[..., 0]) > inner_w) | (np.abs(dots[..., 1]) > inner_h)).any(1)
+
+    out['line_count'] = n_lines != mc.NUM_LINES
+    ends = lines.reshape(n_pat, -1, 2)
+    out['line_boundary'] = ((np.abs(ends[..., 0]) > half_w + TOLERANCE) |
+                            (np.abs(ends[..., 1]) > half_h + TOLERANCE)).any(1)
+    a = lines[:, :, 0, :]; b = lines[:, :, 1, :]          # (P, L, 2)
+    seg = b - a
+    length = np.sqrt((seg ** 2).sum(-1))
+    out['line_length'] = ((length < mc.MIN_LINE_LENGTH - TOLERANCE) |
+                          (length > mc.MAX_LINE_LENGTH + TOLERANCE)).any(1)
+
+    # connecting lines: both endpoints are dot centres and those two dots form a pair
+    at_a = (a[:, :, None, :] == dots[:, None, :, :]).all(-1)     # (P, L, n)
+    at_b = (b[:, :, None, :] == dots[:, None, :, :]).all(-1)
+    ia = at_a.argmax(-1); ib = at_b.argmax(-1)
+    pair_valid = (pairs >= 0).all(-1) & (pairs < n_found[:, None, None]).all(-1)
+    paired = np.zeros((n_pat, n + 1, n + 1), dtype=bool)
+    pi = np.where(pair_valid[..., None], pairs, n)
+    rows = np.repeat(np.arange(n_pat), pairs.shape[1])
+    paired[rows, pi[..., 0].ravel(), pi[..., 1].ravel()] = True
+    paired[rows, pi[..., 1].ravel(), pi[..., 0].ravel()] = True
+    paired[:, n, n] = False
+    rows_l = np.arange(n_pat)[:, None]
+    connecting = at_a.any(-1) & at_b.any(-1) & paired[rows_l, ia, ib] & line_ok
+
+    # connections: n_connection valid pairs, no dot in two pairs, one connecting line per pair
+    uses = np.zeros((n_pat, n + 1), dtype=np.int64)
+    np.add.at(uses, (rows, pi[..., 0].ravel()), 1)
+    np.add.at(uses, (rows, pi[..., 1].ravel()), 1)
+    n_valid_pairs = pair_valid.sum(1)
+    out['connections'] = ((n_pairs != n_connection) | (n_valid_pairs != n_pairs) |
+                          (uses[:, :n] > 1).any(1) | (connecting.sum(1) != n_connection))
+
+    # point-to-segment distance of every dot to every line (P, L, n)
+    rel = dots[:, None, :, :] - a[:, :, None, :]
+    seg_len2 = (seg ** 2).sum(-1)[..., None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.clip((rel * seg[:, :, None, :]).sum(-1) / seg_len2, 0, 1)
+        t = np.where(seg_len2 > 0, t, 0)
+    nearest = a[:, :, None, :] + t[..., None] * seg[:, :, None, :]
+    clearance = np.sqrt(((dots[:, None, :, :] - nearest) ** 2).sum(-1))
+    dot_index = np.arange(n)[None, None, :]
+    exempt = connecting[..., None] & ((dot_index == ia[..., None]) | (dot_index == ib[..., None]))
+    out['line_dot_clearance'] = ((clearance < mc.MIN_LINE_DOT_DISTANCE - TOLERANCE) & ~exempt).any((1, 2))
+
+    # crossings, same test as merged_checked.lines_intersect, for every line pair
+    x1, y1 = a[:, :, None, 0], a[:, :, None, 1]
+    x2, y2 = b[:, :, None, 0], b[:, :, None, 1]
+    x3, y3 = a[:, None, :, 0], a[:, None, :, 1]
+    x4, y4 = b[:, None, :, 0], b[:, None, :, 1]
+    denom = (x1-x2)*(y3-y4) - (y1-y2)*(x3-x4)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tt = ((x1-x3)*(y3-y4) - (y1-y3)*(x3-x4)) / denom
+        uu = -((x1-x2)*(y1-y3) - (y1-y2)*(x1-x3)) / denom
+    cross = (np.abs(denom) >= 1e-10) & (tt > 0) & (tt < 1) & (uu > 0) & (uu < 1)
+    out['line_intersection'] = np.triu(cross, 1).any((1, 2))
+    return out
+
+def validate(patterns):
+    """{rule: bool array over patterns}, computed in chunks of CHUNK_PATTERNS."""
+    if not patterns:
+        return {rule: np.zeros(0, dtype=bool) for rule in RULES}
+    parts = [check_chunk(patterns[lo:lo + CHUNK_PATTERNS]) for lo in range(0, len(patterns), CHUNK_PATTERNS)]
+    return {rule: np.concatenate([p[rule] for p in parts]) for rule in RULES}
+
+def violations(labels, patterns):
+    """[(label, rule)] for every violated rule of every pattern, in pattern order."""
+    failed = validate(patterns)
+    bad = np.stack([failed[rule] for rule in RULES], axis=1)
+    return [(labels[i], RULES[r]) for i, r in zip(*np.nonzero(bad))]
+
+# -----------------------
+# MAIN
+# -----------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check pattern libraries against all geometric rules.")
+    parser.add_argument('paths', nargs='+', help="library files (.json) or directories containing them")
+    parser.add_argument('--out', default=None, help="write violations (library, pattern, rule) as CSV here")
+    args = parser.parse_args(argv)
+
+    files = find_libraries(args.paths)
+    if not files:
+        parser.error("no library files found")
+    found = []
+    n_patterns = 0
+    start = time.perf_counter()
+    for path in files:
+        labels, patterns = library_patterns(path)
+        n_patterns += len(patterns)
+        found.extend((path, label, rule) for label, rule in violations(labels, patterns))
+    elapsed = time.perf_counter() - start
+
+    counts = {rule: sum(1 for f in found if f[2] == rule) for rule in RULES}
+    for rule in RULES:
+        print(f"{rule:<20} {counts[rule]:>8}", file=sys.stderr)
+    print(f"Checked {n_patterns} patterns in {len(files)} files ({elapsed:.1f} s): "
+          f"{len({(f[0], f[1]) for f in found})} invalid.", file=sys.stderr)
+
+    out = open(args.out, 'w', newline='') if args.out else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(['library', 'pattern', 'rule'])
+        writer.writerows(found)
+    finally:
+        if args.out:
+            out.close()
+    return 1 if found else 0
+
+if __name__ == "__main__":
+    sys.exit(main())